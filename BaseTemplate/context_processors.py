@@ -8,18 +8,16 @@ def theme(request):
         'theme': theme
     }
 
+def cart_badge(request):
+    """Expose the cart item counts for the header badge (kept in the session, see cart.badge)."""
+    from cart import badge
+    return {
+        'cart_badge': badge.counts(request)
+    }
+
 def company_settings(request):
-    """Expose company settings to all templates."""
-    from Core.models import CompanySettings
-    settings = CompanySettings.objects.first()
-    if not settings:
-        # Create default if none exists
-        settings = CompanySettings.objects.create(
-            company_name='Migi Shoes',
-            contact_email='info@migishoes.com',
-            contact_phone='+254715462406',
-            business_hours='Monday - Friday, 9 AM - 6 PM EAT'
-        )
+    """Expose company settings to all templates (cached in process, see Core.company)."""
+    from Core.company import company_settings
     return {
-        'company': settings
+        'company': company_settings()
     }
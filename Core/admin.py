@@ -1,5 +1,5 @@
 from django.contrib import admin
-from . import models
+from . import models, outbox
 
 class CompanySettingsAdmin(admin.ModelAdmin):
     list_display = ('company_name', 'contact_email', 'contact_phone')
@@ -17,3 +17,18 @@ class CompanySettingsAdmin(admin.ModelAdmin):
     )
 
 admin.site.register(models.CompanySettings, CompanySettingsAdmin)
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['requeue_dead']
+
+    @admin.action(description='Requeue selected dead emails')
+    def requeue_dead(self, request, queryset):
+        count = outbox.requeue(queryset)
+        self.message_user(request, f'{count} emails requeued.')
+
+admin.site.register(models.OutboxEmail, OutboxEmailAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Core'
+
+    def ready(self):
+        # expire the cached company settings when they change
+        import Core.signals
@@ -0,0 +1,75 @@
+"""Process-local CompanySettings.
+
+The settings row is read on every page (header, footer, shipping fee) but
+changes only when an admin edits it. company_settings() keeps it in process
+memory and checks a version stamp in the shared cache at most every
+CHECK_INTERVAL seconds. Saving or deleting the row bumps the stamp after
+commit (see Core.signals), so every process reloads the row once.
+
+The returned instance is shared between requests: read it, don't modify it.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+from .models import CompanySettings
+
+VERSION_KEY = 'core:company_settings_version'
+CHECK_INTERVAL = 30
+DEFAULTS = {
+    'company_name': 'Migi Shoes',
+    'contact_email': 'info@migishoes.com',
+    'contact_phone': '+254715462406',
+    'business_hours': 'Monday - Friday, 9 AM - 6 PM EAT',
+}
+
+_lock = threading.Lock()
+# (settings, version, monotonic time of the last version check)
+_state = (None, None, 0.0)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # seeded from the clock so a stamp lost to eviction never repeats an old one
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _load():
+    settings = CompanySettings.objects.first()
+    if settings is None:
+        settings = CompanySettings.objects.create(**DEFAULTS)
+        # field defaults such as shipping_fee are floats until read back as Decimals
+        settings.refresh_from_db()
+    return settings
+
+
+def company_settings():
+    """The CompanySettings row, created with DEFAULTS if there is none yet."""
+    global _state
+    settings, version, checked_at = _state
+    now = time.monotonic()
+    if settings is not None and now - checked_at < CHECK_INTERVAL:
+        return settings
+    with _lock:
+        settings, version, checked_at = _state
+        if settings is not None and now - checked_at < CHECK_INTERVAL:
+            return settings
+        current = _version()
+        if settings is None or current != version:
+            settings = _load()
+        _state = (settings, current, now)
+        return settings
+
+
+def invalidate():
+    """Make every process reload the settings; this one on its next call."""
+    global _state
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    _state = (None, None, 0.0)
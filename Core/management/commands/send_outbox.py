@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Core import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE, help='Emails claimed per batch.')
+        parser.add_argument('--max-attempts', type=int, default=outbox.MAX_ATTEMPTS, help='Attempts before an email is marked dead.')
+        parser.add_argument('--once', action='store_true', help='Deliver what is due now and exit instead of polling.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = outbox.drain(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            except Exception as error:
+                # e.g. the mail server refused the connection; claimed emails become due again
+                if options['once']:
+                    raise
+                self.stderr.write(f'Outbox delivery failed: {error}')
+                sent = failed = 0
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed.')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Outbox drained.'))
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -22,3 +23,34 @@ class CompanySettings(models.Model):
     class Meta:
         verbose_name = 'Company Settings'
         verbose_name_plural = 'Company Settings'
+
+
+class OutboxEmail(models.Model):
+    """Email waiting to be delivered by the send_outbox worker (see Core.outbox)."""
+    STATUS_CHOICES = {
+        'pending': 'Pending',
+        'sent': 'Sent',
+        'dead': 'Dead',
+    }
+
+    subject = models.CharField(max_length=255, help_text='Subject line.')
+    body = models.TextField(help_text='Plain text body.')
+    from_email = models.CharField(max_length=254, blank=True, help_text='Sender; blank uses DEFAULT_FROM_EMAIL.')
+    to = models.JSONField(default=list, help_text='Recipient addresses.')
+    reply_to = models.JSONField(default=list, blank=True, help_text='Reply-To addresses.')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', help_text='Delivery state.')
+    attempts = models.PositiveSmallIntegerField(default=0, help_text='Delivery attempts so far.')
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text='Earliest time the worker may try (again).')
+    last_error = models.TextField(blank=True, help_text='Error of the last failed attempt.')
+    created_at = models.DateTimeField(auto_now_add=True, help_text='When the email was queued.')
+    sent_at = models.DateTimeField(null=True, blank=True, help_text='When the email was delivered.')
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Outbox Email'
+        verbose_name_plural = 'Outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
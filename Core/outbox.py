@@ -0,0 +1,127 @@
+"""Email outbox: queue in the request, deliver from a worker.
+
+Views call enqueue(), which is a single INSERT, so a slow or unreachable mail
+server never holds up a request. The send_outbox management command drains
+the table with one mail connection reused across batches. Failed messages
+are retried with exponential backoff; after MAX_ATTEMPTS they are marked dead
+and left for an admin to inspect or requeue.
+
+Each batch is claimed by pushing its next_attempt_at forward by
+CLAIM_SECONDS before sending, so concurrent workers don't pick the same rows,
+and rows held by a crashed worker become due again on their own.
+"""
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 60 * 60 * 6
+CLAIM_SECONDS = 60 * 5
+
+
+def enqueue(subject, body, to, from_email='', reply_to=()):
+    """Queue an email for the worker. Returns the OutboxEmail row."""
+    return OutboxEmail.objects.create(
+        subject=subject, body=body, from_email=from_email or '', to=list(to), reply_to=list(reply_to)
+    )
+
+
+def backoff(attempts):
+    """Delay before retrying a message that has failed ``attempts`` times."""
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """Due pending messages, oldest first, claimed for this worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[message.pk for message in batch]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return batch
+
+
+def _message(outbox_email, connection):
+    return EmailMessage(
+        subject=outbox_email.subject,
+        body=outbox_email.body,
+        from_email=outbox_email.from_email or None,
+        to=outbox_email.to,
+        reply_to=outbox_email.reply_to,
+        connection=connection,
+    )
+
+
+def _failed(outbox_email, error, max_attempts):
+    outbox_email.attempts += 1
+    outbox_email.last_error = f'{type(error).__name__}: {error}'
+    if outbox_email.attempts >= max_attempts:
+        outbox_email.status = 'dead'
+    else:
+        outbox_email.next_attempt_at = timezone.now() + backoff(outbox_email.attempts)
+    outbox_email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def _reconnect(connection):
+    connection.close()
+    try:
+        connection.open()
+    except Exception:
+        # still down: the next send retries the connection and fails that message in turn
+        pass
+
+
+def deliver_batch(connection, batch, max_attempts=MAX_ATTEMPTS):
+    """Send a claimed batch over an open connection. Returns ``(sent, failed)``."""
+    sent = failed = 0
+    for outbox_email in batch:
+        try:
+            connection.send_messages([_message(outbox_email, connection)])
+        except Exception as error:
+            _failed(outbox_email, error, max_attempts)
+            failed += 1
+            # the server may have dropped us; start the next message on a fresh connection
+            _reconnect(connection)
+            continue
+        outbox_email.status = 'sent'
+        outbox_email.attempts += 1
+        outbox_email.sent_at = timezone.now()
+        outbox_email.last_error = ''
+        outbox_email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+        sent += 1
+    return sent, failed
+
+
+def drain(batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS, connection=None):
+    """Deliver every message that is due now. Returns ``(sent, failed)``."""
+    sent = failed = 0
+    batch = claim_batch(batch_size)
+    if not batch:
+        return sent, failed
+    connection = connection or get_connection()
+    # one connection (one SMTP login) for every batch of this run
+    with connection:
+        while batch:
+            batch_sent, batch_failed = deliver_batch(connection, batch, max_attempts)
+            sent += batch_sent
+            failed += batch_failed
+            batch = claim_batch(batch_size)
+    return sent, failed
+
+
+def requeue(queryset):
+    """Give dead messages a fresh set of attempts. Returns the number requeued."""
+    return queryset.filter(status='dead').update(
+        status='pending', attempts=0, next_attempt_at=timezone.now(), last_error=''
+    )
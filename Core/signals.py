@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import company
+from .models import CompanySettings
+
+
+@receiver(post_save, sender=CompanySettings)
+@receiver(post_delete, sender=CompanySettings)
+def company_settings_changed(sender, **kwargs):
+    # after commit, so no process can reload the old row under the new stamp
+    transaction.on_commit(company.invalidate)
@@ -1,3 +1,74 @@
-from django.test import TestCase
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+from . import company, outbox
+from .models import CompanySettings, OutboxEmail
+
+
+class FailingBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('mail server down')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    def enqueue(self, subject='Hello'):
+        return outbox.enqueue(subject, 'Body', ['admin@example.com'], reply_to=['visitor@example.com'])
+
+    def test_drain_sends_due_messages_once(self):
+        message = self.enqueue()
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].reply_to, ['visitor@example.com'])
+
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('sent', 1))
+        self.assertEqual(outbox.drain(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failures_back_off_then_go_dead(self):
+        message = self.enqueue()
+        self.assertEqual(outbox.drain(max_attempts=2, connection=FailingBackend()), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertIn('mail server down', message.last_error)
+
+        # not due yet, so nothing is claimed
+        self.assertEqual(outbox.drain(max_attempts=2, connection=FailingBackend()), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.drain(max_attempts=2, connection=FailingBackend()), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('dead', 2))
+
+        self.assertEqual(outbox.requeue(OutboxEmail.objects.all()), 1)
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(OutboxEmail.objects.get().status, 'sent')
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual(outbox.backoff(1).total_seconds(), outbox.BACKOFF_SECONDS)
+        self.assertEqual(outbox.backoff(3).total_seconds(), outbox.BACKOFF_SECONDS * 4)
+        self.assertEqual(outbox.backoff(50).total_seconds(), outbox.MAX_BACKOFF_SECONDS)
+
+
+class CompanySettingsTests(TestCase):
+    def setUp(self):
+        company.invalidate()
+        self.addCleanup(company.invalidate)
+
+    def test_row_is_created_once_and_kept_in_memory(self):
+        settings = company.company_settings()
+        self.assertEqual(settings.company_name, company.DEFAULTS['company_name'])
+        with self.assertNumQueries(0):
+            self.assertIs(company.company_settings(), settings)
+        self.assertEqual(CompanySettings.objects.count(), 1)
+
+    def test_saving_reloads_after_commit(self):
+        settings = CompanySettings.objects.get(pk=company.company_settings().pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            settings.company_name = 'Olivian'
+            settings.save()
+        self.assertEqual(company.company_settings().company_name, 'Olivian')
@@ -90,6 +90,7 @@ TEMPLATES = [
                 # expose theme (from cookie) to all templates
                 'BaseTemplate.context_processors.theme',
                 'BaseTemplate.context_processors.company_settings',
+                'BaseTemplate.context_processors.cart_badge',
             ],
         },
     },
@@ -110,6 +111,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The default local-memory cache is per process; point CACHE_BACKEND at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -164,7 +177,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 # Email Configuration
-# Choose email provider: 'sendgrid', 'mailgun', 'smtp', 'console'
+# Choose email provider: 'sendgrid', 'mailgun', 'smtp', 'file', 'locmem', 'console'
+# Emails are queued in the Core outbox and delivered by `manage.py send_outbox`
 EMAIL_PROVIDER = config('EMAIL_PROVIDER', default='smtp')
 
 if EMAIL_PROVIDER == 'sendgrid':
@@ -194,6 +208,15 @@ elif EMAIL_PROVIDER == 'smtp':
     EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
     EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 
+elif EMAIL_PROVIDER == 'file':
+    # Offline stand-in: each message is written to a file in EMAIL_FILE_PATH
+    EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+    EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
+
+elif EMAIL_PROVIDER == 'locmem':
+    # Offline stand-in: messages are kept in django.core.mail.outbox
+    EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
 else:
     # Console backend for development/debugging
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -3,7 +3,7 @@ from django.template.response import TemplateResponse
 from django.urls import path
 from django.db.models import Sum, Count, F
 
-from models_app.models import Customer, Order, OrderItem, Shoe, ShoeVariant
+from models_app.models import Customer, Order, OrderItem, Shoe, ShoeVariant, primary_image_prefetch
 
 # https://docs.djangoproject.com/en/5.2/ref/contrib/admin/#overriding-default-admin-site
 class MigiShoesAdmin(admin.AdminSite):
@@ -54,6 +54,7 @@ class MigiShoesAdmin(admin.AdminSite):
             low_stock_variants = (
                 ShoeVariant.objects.filter(stock__lte=5)
                 .select_related('shoe')
+                .prefetch_related(primary_image_prefetch('shoe__images'))
                 .order_by('stock', 'shoe__name')
             )
             template = "admin/dashboard_inventory.html"
@@ -68,7 +69,7 @@ class MigiShoesAdmin(admin.AdminSite):
             cancelled_orders = (
                 Order.objects.filter(status='Cancelled')
                 .select_related('customer__user')
-                .prefetch_related('items')
+                .prefetch_related('items__variant__shoe', primary_image_prefetch('items__variant__shoe__images'))
                 .order_by('-order_date')
             )
             template = "admin/dashboard_orders.html"
@@ -80,8 +81,8 @@ class MigiShoesAdmin(admin.AdminSite):
 
         # Pricing Manager
         if user.groups.filter(name='Pricing Manager').exists():
-            top_expensive = Shoe.objects.order_by('-price')[:5]
-            top_cheap = Shoe.objects.order_by('price')[:5]
+            top_expensive = Shoe.objects.with_primary_image().order_by('-price')[:5]
+            top_cheap = Shoe.objects.with_primary_image().order_by('price')[:5]
             template = "admin/dashboard_pricing.html"
             context = self.each_context(request)
             context.update({
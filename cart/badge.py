@@ -0,0 +1,68 @@
+"""Cart badge counts kept in the session.
+
+The header shows how many items are in the cart on every page. Instead of
+loading the cart for that, the counts are stored in the session and
+recomputed by refresh() whenever a cart view changes the cart. The stored
+counts remember which user they were computed for, so logging in or out
+recomputes them once. Whether the user has a customer profile (which the
+header also needs for its account link) is stored alongside.
+
+Anonymous visitors' carts already live in the session, so their counts are
+read straight from it and never stored: a first page view doesn't write (and
+so create) a session.
+"""
+from django.db.models import Count, Sum
+
+from models_app.models import CartItem, Customer
+
+SESSION_KEY = 'cart_badge'
+
+
+def _session_counts(cart):
+    return {'items': len(cart), 'quantity': sum(int(quantity) for quantity in cart.values())}
+
+
+def compute(request):
+    """``{'items': distinct variants, 'quantity': units}`` in the request's cart."""
+    if request.user.is_authenticated:
+        counts = CartItem.objects.filter(customer__user_id=request.user.pk).aggregate(
+            items=Count('pk'), quantity=Sum('quantity')
+        )
+        if counts['items']:
+            return counts
+    # anonymous visitors and users without a customer profile keep their cart in the session
+    return _session_counts(request.session.get('cart', {}))
+
+
+def refresh(request, priced=None):
+    """Recompute and store the counts; call after changing the cart.
+
+    Pass the cart's CartPricing when it is at hand to skip the count query.
+    """
+    if not request.user.is_authenticated:
+        return _anonymous_counts(request)
+    if priced is None:
+        counts = compute(request)
+    else:
+        counts = {'items': len(priced.lines), 'quantity': priced.quantity}
+    stored = request.session.get(SESSION_KEY)
+    if stored is not None and stored.get('user') == request.user.pk:
+        counts['customer'] = stored['customer']
+    else:
+        counts['customer'] = Customer.objects.filter(user_id=request.user.pk).exists()
+    request.session[SESSION_KEY] = {'user': request.user.pk, **counts}
+    return counts
+
+
+def _anonymous_counts(request):
+    return {**_session_counts(request.session.get('cart', {})), 'customer': False}
+
+
+def counts(request):
+    """``{'items', 'quantity', 'customer'}``, computed on first use and after a login or logout."""
+    if not request.user.is_authenticated:
+        return _anonymous_counts(request)
+    stored = request.session.get(SESSION_KEY)
+    if stored is None or stored.get('user') != request.user.pk:
+        return refresh(request)
+    return {key: stored[key] for key in ('items', 'quantity', 'customer')}
@@ -0,0 +1,100 @@
+"""Cart pricing shared by the cart summary and checkout.
+
+Session carts and database carts are loaded with all their variants, shoes
+and primary images up front, then priced in a single pass. The returned
+CartPricing holds plain values, so templates rendering it run no queries.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from Core.company import company_settings
+from models_app.models import CartItem, ShoeVariant, primary_image_prefetch
+
+
+@dataclass(frozen=True)
+class CartLine:
+    id: int  # CartItem id, or the variant id for session carts
+    variant: ShoeVariant
+    quantity: int
+    unit_price: Decimal  # discounted
+    original_unit_price: Decimal
+    total_price: Decimal
+    discount: Decimal
+
+
+@dataclass(frozen=True)
+class CartPricing:
+    lines: list
+    quantity: int
+    original_subtotal: Decimal  # before discounts
+    discount: Decimal
+    subtotal: Decimal  # what the items cost
+    shipping_fee: Decimal
+    total: Decimal  # subtotal plus shipping
+
+
+def price_lines(lines, shipping_fee=None):
+    """Price ``(id, variant, quantity)`` triples whose variants have their shoe loaded."""
+    if shipping_fee is None:
+        shipping_fee = company_settings().shipping_fee
+    priced = []
+    quantity = 0
+    original_subtotal = discount = subtotal = Decimal('0.00')
+    for line_id, variant, line_quantity in lines:
+        shoe = variant.shoe
+        line = CartLine(
+            id=line_id,
+            variant=variant,
+            quantity=line_quantity,
+            unit_price=shoe.price,
+            original_unit_price=shoe.original_price,
+            total_price=shoe.price * line_quantity,
+            discount=shoe.discount * line_quantity if shoe.discount > 0 else Decimal('0.00'),
+        )
+        priced.append(line)
+        quantity += line_quantity
+        original_subtotal += line.original_unit_price * line_quantity
+        discount += line.discount
+        subtotal += line.total_price
+    return CartPricing(
+        lines=priced,
+        quantity=quantity,
+        original_subtotal=original_subtotal,
+        discount=discount,
+        subtotal=subtotal,
+        shipping_fee=shipping_fee,
+        total=subtotal + shipping_fee,
+    )
+
+
+def price_session_cart(session_cart, shipping_fee=None):
+    """Price a ``{variant_id: quantity}`` session cart; variants that no longer exist are dropped."""
+    variants = (
+        ShoeVariant.objects.select_related('shoe')
+        .prefetch_related(primary_image_prefetch('shoe__images'))
+        .in_bulk([int(variant_id) for variant_id in session_cart])
+    )
+    lines = [
+        (int(variant_id), variants[int(variant_id)], int(quantity))
+        for variant_id, quantity in session_cart.items()
+        if int(variant_id) in variants
+    ]
+    return price_lines(lines, shipping_fee)
+
+
+def price_customer_cart(customer, shipping_fee=None):
+    """Price a customer's database cart."""
+    items = (
+        CartItem.objects.filter(customer=customer)
+        .select_related('variant__shoe')
+        .prefetch_related(primary_image_prefetch('variant__shoe__images'))
+        .order_by('pk')
+    )
+    return price_lines([(item.pk, item.variant, item.quantity) for item in items], shipping_fee)
+
+
+def price_request_cart(request, shipping_fee=None):
+    """Price the cart the request is shopping with: the customer's, else the session's."""
+    if request.user.is_authenticated and hasattr(request.user, 'customer_profile'):
+        return price_customer_cart(request.user.customer_profile, shipping_fee)
+    return price_session_cart(request.session.get('cart', {}), shipping_fee)
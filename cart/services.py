@@ -0,0 +1,118 @@
+"""Cart mutations, each a single statement.
+
+Customer carts are changed in the database without reading the row first:
+adding is an INSERT ... ON CONFLICT DO UPDATE that adds to the stored
+quantity, and the other changes are conditional UPDATE/DELETE statements
+with F() expressions. Concurrent requests (double clicks, several tabs)
+therefore never lose an increment or trip the unique (customer, variant)
+constraint. Session carts get the same operations on the session dict.
+
+The customer functions return whether a row was changed, so callers can tell
+a missing or foreign item from a successful change.
+"""
+from collections import Counter
+
+from django.db import connection
+from django.db.models import F
+
+from models_app.models import CartItem, ShoeVariant
+
+
+def _upsert_sql(rows=1):
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    customer, variant, quantity = (
+        connection.ops.quote_name(CartItem._meta.get_field(name).column) for name in ('customer', 'variant', 'quantity')
+    )
+    # SQLite (3.24+) and PostgreSQL share this syntax
+    values = ', '.join(['(%s, %s, %s)'] * rows)
+    return (
+        f'INSERT INTO {table} ({customer}, {variant}, {quantity}) VALUES {values} '
+        f'ON CONFLICT ({customer}, {variant}) DO UPDATE SET {quantity} = {table}.{quantity} + excluded.{quantity}'
+    )
+
+
+def add(customer_id, variant_id, quantity=1):
+    """Put ``quantity`` more of a variant in the customer's cart."""
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(), [customer_id, variant_id, quantity])
+    return True
+
+
+def add_many(customer_id, quantities):
+    """Add ``{variant_id: quantity}`` to the customer's cart in one upsert.
+
+    Keys may be strings (as in session carts); keys naming the same variant
+    are summed. Unknown variants and non-positive quantities are dropped.
+    Returns the number of lines added or increased.
+    """
+    wanted = Counter()
+    for variant_id, quantity in quantities.items():
+        try:
+            variant_id, quantity = int(variant_id), int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            wanted[variant_id] += quantity
+    known = ShoeVariant.objects.filter(pk__in=wanted).values_list('pk', flat=True)
+    params = [value for variant_id in sorted(known) for value in (customer_id, variant_id, wanted[variant_id])]
+    if params:
+        with connection.cursor() as cursor:
+            cursor.execute(_upsert_sql(len(params) // 3), params)
+    return len(params) // 3
+
+
+def increment(customer_id, item_id, by=1):
+    return bool(CartItem.objects.filter(pk=item_id, customer_id=customer_id).update(quantity=F('quantity') + by))
+
+
+def decrement(customer_id, item_id, by=1):
+    """Lower a line's quantity, never below 1 (use remove() to drop it)."""
+    return bool(
+        CartItem.objects.filter(pk=item_id, customer_id=customer_id, quantity__gt=by)
+        .update(quantity=F('quantity') - by)
+    )
+
+
+def remove(customer_id, item_id):
+    return bool(CartItem.objects.filter(pk=item_id, customer_id=customer_id).delete()[0])
+
+
+# Session carts are {str(variant_id): quantity}; the line id is the variant id.
+
+def _save_session_cart(session, cart):
+    session['cart'] = cart
+
+
+def session_add(session, variant_id, quantity=1):
+    cart = session.get('cart', {})
+    key = str(variant_id)
+    cart[key] = int(cart.get(key, 0)) + quantity
+    _save_session_cart(session, cart)
+    return True
+
+
+def session_increment(session, variant_id, by=1):
+    cart = session.get('cart', {})
+    key = str(variant_id)
+    if key not in cart:
+        return False
+    cart[key] = int(cart[key]) + by
+    _save_session_cart(session, cart)
+    return True
+
+
+def session_decrement(session, variant_id, by=1):
+    cart = session.get('cart', {})
+    key = str(variant_id)
+    if int(cart.get(key, 0)) <= by:
+        return False
+    cart[key] = int(cart[key]) - by
+    _save_session_cart(session, cart)
+    return True
+
+
+def session_remove(session, variant_id):
+    cart = session.get('cart', {})
+    removed = cart.pop(str(variant_id), None) is not None
+    _save_session_cart(session, cart)
+    return removed
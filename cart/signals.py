@@ -0,0 +1,19 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from models_app.models import Customer
+from . import services
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    """Move the cart built before logging in into the customer's cart."""
+    if request is None or not request.session.get('cart'):
+        return
+    customer_id = Customer.objects.filter(user=user).values_list('pk', flat=True).first()
+    if customer_id is None:
+        # users without a customer profile keep shopping from the session
+        return
+    services.add_many(customer_id, request.session['cart'])
+    # the badge counts are recomputed on the next page, as they were stored for another user
+    del request.session['cart']
@@ -1,3 +1,152 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
 from django.test import TestCase
+from django.urls import reverse
+
+from models_app.models import CartItem, Shoe, ShoeVariant, StockReservation
+from . import services
+
+
+def make_variant(stock=5, color='Black', size=42, shoe=None):
+    if shoe is None:
+        shoe = Shoe.objects.create(
+            name='Air Zoom', description='Running shoe', price=Decimal('1000'), category='running', gender='U'
+        )
+    return ShoeVariant.objects.create(
+        shoe=shoe, color=color, size=size, size_system='EU', stock_management='quantity', stock=stock, in_stock=True
+    )
+
+
+def make_customer(username):
+    # a customer profile is created along with the user
+    return User.objects.create_user(username, f'{username}@example.com', 'pw12345!x').customer_profile
+
+
+class CheckoutReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.variant = make_variant(stock=1)
+        cls.alice = make_customer('alice')
+        cls.bob = make_customer('bob')
+        for customer in (cls.alice, cls.bob):
+            CartItem.objects.create(customer=customer, variant=cls.variant, quantity=1)
+
+    def checkout(self, customer):
+        self.client.force_login(customer.user)
+        return self.client.get(reverse('cart:checkout'))
+
+    def test_reservation_blocks_a_second_checkout(self):
+        self.assertEqual(self.checkout(self.alice).status_code, 200)
+        self.assertTrue(StockReservation.objects.filter(customer=self.alice, variant=self.variant).exists())
+
+        response = self.checkout(self.bob)
+        self.assertRedirects(response, reverse('cart:summary'), fetch_redirect_response=False)
+        self.assertIn('Only 0 left', ' '.join(str(message) for message in get_messages(response.wsgi_request)))
+        self.assertFalse(StockReservation.objects.filter(customer=self.bob).exists())
+
+    def test_reopening_checkout_keeps_the_customers_own_hold(self):
+        self.assertEqual(self.checkout(self.alice).status_code, 200)
+        self.assertEqual(self.checkout(self.alice).status_code, 200)
+        self.assertEqual(StockReservation.objects.get(customer=self.alice).quantity, 1)
+
+
+class CartMutationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.variant = make_variant()
+        cls.other_variant = make_variant(shoe=cls.variant.shoe, color='White')
+        cls.alice = make_customer('alice')
+        cls.bob = make_customer('bob')
+
+    def test_adding_again_increases_the_existing_line(self):
+        services.add(self.alice.pk, self.variant.pk)
+        services.add(self.alice.pk, self.variant.pk, 2)
+        self.assertEqual(
+            list(CartItem.objects.filter(customer=self.alice).values_list('variant_id', 'quantity')),
+            [(self.variant.pk, 3)],
+        )
+
+    def test_add_many_sums_keys_and_drops_bad_entries(self):
+        added = services.add_many(self.alice.pk, {
+            str(self.variant.pk): 2, self.variant.pk: 1, str(self.other_variant.pk): '1',
+            self.other_variant.pk: -5, '999999': 4, 'x': 1,
+        })
+        self.assertEqual(added, 2)
+        self.assertEqual(
+            dict(CartItem.objects.filter(customer=self.alice).values_list('variant_id', 'quantity')),
+            {self.variant.pk: 3, self.other_variant.pk: 1},
+        )
+
+    def test_quantity_changes_stay_within_the_customers_lines(self):
+        item = CartItem.objects.create(customer=self.alice, variant=self.variant, quantity=2)
+        self.assertTrue(services.decrement(self.alice.pk, item.pk))
+        # never below one; remove() drops the line
+        self.assertFalse(services.decrement(self.alice.pk, item.pk))
+        self.assertTrue(services.increment(self.alice.pk, item.pk, 2))
+        self.assertFalse(services.increment(self.bob.pk, item.pk))
+        self.assertFalse(services.remove(self.bob.pk, item.pk))
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 3)
+        self.assertTrue(services.remove(self.alice.pk, item.pk))
+        self.assertFalse(CartItem.objects.filter(pk=item.pk).exists())
+
+    def test_api_rejects_bad_input(self):
+        url = reverse('cart:api_add')
+        self.assertEqual(self.client.post(url, {'variant': 'x'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'variant': self.variant.pk, 'quantity': 0}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'variant': 999999}).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+
+class LoginMergeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.variant = make_variant()
+        cls.other_variant = make_variant(shoe=cls.variant.shoe, color='White')
+        cls.alice = make_customer('alice')
+
+    def add_anonymously(self, variant, quantity):
+        self.client.post(reverse('cart:api_add'), {'variant': variant.pk, 'quantity': quantity})
+
+    def test_session_cart_is_summed_into_the_customer_cart(self):
+        CartItem.objects.create(customer=self.alice, variant=self.variant, quantity=1)
+        self.add_anonymously(self.variant, 2)
+        self.add_anonymously(self.other_variant, 1)
+
+        self.client.force_login(self.alice.user)
+
+        self.assertEqual(
+            dict(CartItem.objects.filter(customer=self.alice).values_list('variant_id', 'quantity')),
+            {self.variant.pk: 3, self.other_variant.pk: 1},
+        )
+        self.assertNotIn('cart', self.client.session)
+
+
+class CartBadgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.variant = make_variant()
+        cls.alice = make_customer('alice')
+
+    def badge(self):
+        return self.client.get(reverse('storefront:home')).context['cart_badge']
+
+    def test_first_anonymous_page_view_creates_no_session(self):
+        response = self.client.get(reverse('storefront:home'))
+        self.assertEqual(response.context['cart_badge'], {'items': 0, 'quantity': 0, 'customer': False})
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_anonymous_badge_follows_the_session_cart(self):
+        self.client.post(reverse('cart:api_add'), {'variant': self.variant.pk, 'quantity': 2})
+        self.assertEqual(self.badge(), {'items': 1, 'quantity': 2, 'customer': False})
+        self.assertNotIn('cart_badge', self.client.session)
 
-# Create your tests here.
+    def test_customer_badge_is_stored_and_refreshed_by_cart_changes(self):
+        self.client.force_login(self.alice.user)
+        self.assertEqual(self.badge(), {'items': 0, 'quantity': 0, 'customer': True})
+        self.client.post(reverse('cart:api_add'), {'variant': self.variant.pk, 'quantity': 3})
+        self.assertEqual(self.client.session['cart_badge']['quantity'], 3)
+        self.assertEqual(self.badge()['quantity'], 3)
@@ -9,4 +9,8 @@ urlpatterns = [
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove_item'),
     path('checkout/', views.checkout, name="checkout"),
     path('update/<int:item_id>/', views.update_quantity, name='update_quantity'), 
+    path('api/', views.api_cart, name='api_cart'),
+    path('api/add/', views.api_add, name='api_add'),
+    path('api/update/<int:item_id>/', views.api_update, name='api_update'),
+    path('api/remove/<int:item_id>/', views.api_remove, name='api_remove'),
 ]
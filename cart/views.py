@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
 from models_app.models import ShoeVariant
 from models_app.models import CartItem
 from models_app.models import Order, OrderItem, Notification
@@ -7,96 +8,73 @@ from models_app.models import Address, PaymentMethod
 from django.core.exceptions import ValidationError
 from .forms import AddressForm, PaymentMethodForm, ContactForm
 from django.urls import reverse
-from django.http import HttpResponseRedirect
-from decimal import Decimal
-from Core.models import CompanySettings
+from django.http import HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_GET, require_POST
+from products import reservations
+from . import badge, pricing, services
+
+def _customer_id(request):
+    """Id of the customer whose DB cart the request uses, or None for a session cart."""
+    if request.user.is_authenticated and hasattr(request.user, 'customer_profile'):
+        return request.user.customer_profile.pk
+    return None
+
+
+def _add(request, variant_id, quantity=1):
+    customer_id = _customer_id(request)
+    if customer_id is not None:
+        return services.add(customer_id, variant_id, quantity)
+    return services.session_add(request.session, variant_id, quantity)
+
+
+def _update(request, item_id, action):
+    """Apply an 'increment' or 'decrement' action; returns whether the line changed."""
+    customer_id = _customer_id(request)
+    if customer_id is not None:
+        change = {'increment': services.increment, 'decrement': services.decrement}.get(action)
+        return change(customer_id, item_id) if change else False
+    change = {'increment': services.session_increment, 'decrement': services.session_decrement}.get(action)
+    return change(request.session, item_id) if change else False
+
+
+def _remove(request, item_id):
+    # already gone (e.g. a double click) is not an error
+    customer_id = _customer_id(request)
+    if customer_id is not None:
+        return services.remove(customer_id, item_id)
+    # item_id for session mode is the variant_id
+    return services.session_remove(request.session, item_id)
+
 
 def add_to_cart(request):
     """Add a variant to the cart using session for anonymous users or DB for authenticated users.
     """
     variant_id = request.POST.get('variant')
     variant = get_object_or_404(ShoeVariant, variant_id=variant_id)
+    _add(request, variant.variant_id)
+    badge.refresh(request)
+    return redirect('cart:summary')
 
-    if request.user.is_authenticated and hasattr(request.user, 'customer_profile'):
-        customer = request.user.customer_profile
-
-        cart_item, created = CartItem.objects.get_or_create(
-            customer=customer,
-            variant=variant,
-            defaults={'quantity': 1}
-        )
-
-        if not created:
-            cart_item.quantity += 1
-            cart_item.save()
-    else:
-        cart = request.session.get('cart', {})
-        # store quantities as ints; keys as strings
-        cart[str(variant.variant_id)] = int(cart.get(str(variant.variant_id), 0)) + 1
-        request.session['cart'] = cart
 
-    return redirect('cart:summary')
+def _totals(cart):
+    """Template context for a priced cart's lines and totals."""
+    return {
+        'cart_items': cart.lines,
+        'total': cart.subtotal,
+        'shipping_fee': cart.shipping_fee,
+        'final_total': cart.total,
+        'pricing': cart,
+    }
 
 
 def cart_summary(request):
     """Render cart summary for authenticated users (DB cart) or anonymous users (session cart)."""
-    company = CompanySettings.objects.first()
-    shipping_fee = company.shipping_fee if company else Decimal('150.00')
-
-    if request.user.is_authenticated and hasattr(request.user, 'customer_profile'):
-        customer = request.user.customer_profile
-        cart_items = CartItem.objects.filter(customer=customer)
-
-        subtotal = sum(item.variant.shoe.price * item.quantity for item in cart_items)
-        final_total = subtotal + shipping_fee
-
-        return render(request, 'cart/summary.html', {
-            'cart_items': cart_items,
-            'total': subtotal,
-            'shipping_fee': shipping_fee,
-            'final_total': final_total,
-        })
-
-    # anonymous/session cart
-    session_cart = request.session.get('cart', {})
-    cart_items = []
-    subtotal = 0
-
-    for variant_id, qty in session_cart.items():
-        variant = ShoeVariant.objects.filter(variant_id=variant_id).first()
-        if not variant:
-            continue
-        item_total = (variant.shoe.price) * int(qty)  # discounted price for display
-        subtotal += item_total  # discounted prices for subtotal
-
-        cart_item = {
-            'id': variant.variant_id,  # used by template for url of shoe
-            'variant': variant,
-            'quantity': int(qty),
-            'total_price': item_total,
-        }
-        cart_items.append(cart_item)
-
-    final_total = subtotal + shipping_fee
-
-    return render(request, 'cart/summary.html', {
-        'cart_items': cart_items,
-        'total': subtotal,
-        'shipping_fee': shipping_fee,
-        'final_total': final_total,
-    })
+    return render(request, 'cart/summary.html', _totals(pricing.price_request_cart(request)))
 
 def remove_from_cart(request, item_id):
-    #for logged-in customer
-    if request.user.is_authenticated and hasattr(request.user, 'customer_profile'):
-        item = get_object_or_404(CartItem, id=item_id, customer=request.user.customer_profile)
-        item.delete()
-    else: #anonymous user
-        cart = request.session.get('cart', {})
-        # item_id for session mode is the variant_id
-        cart.pop(str(item_id), None)
-        request.session['cart'] = cart
-
+    _remove(request, item_id)
+    badge.refresh(request)
     return redirect('cart:summary')
 
 def update_quantity(request, item_id):
@@ -105,39 +83,114 @@ def update_quantity(request, item_id):
         return redirect('cart:summary')
 
     #increment or decrement action
+    _update(request, item_id, request.POST.get('action'))
+    badge.refresh(request)
+    return redirect('cart:summary')
+
+
+###       JSON cart API
+# Same operations as the views above, answered with the repriced cart instead
+# of a redirect. Pass fragment=1 to also get the re-rendered summary rows.
+
+MAX_ADD_QUANTITY = 10
+
+
+def _line_json(line):
+    variant = line.variant
+    return {
+        'id': line.id,
+        'variant_id': variant.variant_id,
+        'shoe_id': variant.shoe_id,
+        'name': variant.shoe.name,
+        'color': variant.color,
+        'size': f'{variant.size_system} {variant.size.normalize():f}',
+        'quantity': line.quantity,
+        'unit_price': line.unit_price,
+        'total_price': line.total_price,
+    }
+
+
+def _cart_json(request, changed=None, line_id=None, variant_id=None, all_lines=False):
+    """Reprice the cart, refresh the badge and describe the result.
+
+    The changed line is found by its line id, or by variant id after an add
+    (a DB line's id is not known until then); it is None once removed.
+    """
+    cart = pricing.price_request_cart(request)
+    badge.refresh(request, cart)
+    payload = {
+        'cart': {
+            'items': len(cart.lines),
+            'quantity': cart.quantity,
+            'subtotal': cart.subtotal,
+            'discount': cart.discount,
+            'shipping_fee': cart.shipping_fee,
+            'total': cart.total,
+        },
+    }
+    if changed is not None:
+        line = next(
+            (line for line in cart.lines
+             if line.id == line_id or (variant_id is not None and line.variant.variant_id == variant_id)),
+            None,
+        )
+        payload['changed'] = changed
+        payload['line'] = _line_json(line) if line else None
+    if all_lines:
+        payload['lines'] = [_line_json(line) for line in cart.lines]
+    if request.GET.get('fragment') or request.POST.get('fragment'):
+        payload['html'] = render_to_string('cart/includes/summary_body.html', _totals(cart), request=request)
+    return JsonResponse(payload)
+
+
+@require_GET
+def api_cart(request):
+    return _cart_json(request, all_lines=True)
+
+
+@require_POST
+def api_add(request):
+    try:
+        variant_id = int(request.POST.get('variant', ''))
+        quantity = int(request.POST.get('quantity', 1))
+    except ValueError:
+        return JsonResponse({'error': 'Pass a numeric variant and quantity.'}, status=400)
+    if not 1 <= quantity <= MAX_ADD_QUANTITY:
+        return JsonResponse({'error': f'Quantity must be 1 to {MAX_ADD_QUANTITY}.'}, status=400)
+    if not ShoeVariant.objects.filter(variant_id=variant_id).exists():
+        return JsonResponse({'error': 'Unknown variant.'}, status=404)
+    changed = _add(request, variant_id, quantity)
+    return _cart_json(request, changed, variant_id=variant_id)
+
+
+@require_POST
+def api_update(request, item_id):
     action = request.POST.get('action')
+    if action not in ('increment', 'decrement'):
+        return JsonResponse({'error': "Action must be 'increment' or 'decrement'."}, status=400)
+    return _cart_json(request, _update(request, item_id, action), line_id=item_id)
 
-    #logged-in customer
-    if request.user.is_authenticated and hasattr(request.user, 'customer_profile'):
-        item = get_object_or_404(CartItem, id=item_id, customer=request.user.customer_profile)
-
-        if action == 'increment':
-            item.quantity += 1
-            item.save()
-        elif action == 'decrement' and item.quantity > 1:
-            item.quantity -= 1
-            item.save()
-
-    else: #anonymous user
-        cart = request.session.get('cart', {})
-        key = str(item_id)
-        if key in cart:
-            if action == 'increment':
-                cart[key] = int(cart.get(key, 0)) + 1
-            elif action == 'decrement':
-                if int(cart.get(key, 0)) > 1:
-                    cart[key] = int(cart.get(key, 0)) - 1
-        request.session['cart'] = cart
 
-    return redirect('cart:summary')
+@require_POST
+def api_remove(request, item_id):
+    return _cart_json(request, _remove(request, item_id), line_id=item_id)
 
 @login_required
 def checkout(request):
-    company = CompanySettings.objects.first()
-    shipping_fee = company.shipping_fee if company else Decimal('150.00')
-
     customer = request.user.customer_profile
-    cart_items = customer.cart_items.all()  # via related name
+    cart = pricing.price_customer_cart(customer)
+
+    # hold the units while the customer fills in the forms; send them back now if some are gone
+    shortfalls = reservations.reserve_cart(customer.pk, cart.lines)
+    if shortfalls:
+        for line in cart.lines:
+            if line.variant.variant_id in shortfalls:
+                messages.warning(
+                    request,
+                    f"Only {shortfalls[line.variant.variant_id]} left of {line.variant}; please lower the quantity.",
+                )
+        return redirect('cart:summary')
+
     addresses = customer.addresses.all()
     payment_methods = customer.payment_methods.all()
 
@@ -237,13 +290,8 @@ def checkout(request):
             payment_form.add_error(None, 'Please select a payment method.')
 
         if not valid:
-            subtotal = sum(item.variant.shoe.price * item.quantity for item in cart_items)
-            final_total = subtotal + shipping_fee
             return render(request, 'cart/checkout.html', {
-                'cart_items': cart_items,
-                'total': subtotal,
-                'shipping_fee': shipping_fee,
-                'final_total': final_total,
+                **_totals(cart),
                 'customer': customer,
                 'addresses': addresses,
                 'payment_methods': payment_methods,
@@ -258,28 +306,24 @@ def checkout(request):
             })
 
         # Create order using Address FKs
-        total = sum(item.variant.shoe.original_price * item.quantity for item in cart_items)
-        discount = sum(item.variant.shoe.discount * item.quantity for item in cart_items)
-        final_total = total - discount
-
         order = Order.objects.create(
             customer=customer,
-            total_price=final_total,
+            total_price=cart.subtotal,
             shipping_address=shipping_address_obj,
             billing_address=billing_address_obj,
             payment_method=payment_method_obj,
             status='Pending',
-            discount_amount=discount,
-            subtotal=total,
-            shipping_cost=shipping_fee,
+            discount_amount=cart.discount,
+            subtotal=cart.original_subtotal,
+            shipping_cost=cart.shipping_fee,
         )
 
-        for item in cart_items:
+        for item in cart.lines:
             OrderItem.objects.create(
                 order=order,
                 variant=item.variant,
                 quantity=item.quantity,
-                price=item.variant.shoe.price,
+                price=item.unit_price,
             )
 
         Notification.objects.create(
@@ -288,20 +332,16 @@ def checkout(request):
             related_order=order,
         )
 
-        # Clear cart
-        cart_items.delete()
+        # Clear cart (only the lines that were ordered); the order now holds the stock
+        CartItem.objects.filter(customer=customer, pk__in=[item.id for item in cart.lines]).delete()
+        reservations.release(customer.pk)
+        badge.refresh(request)
 
         return redirect('customer:customer_orders')
 
     # GET: render checkout
-    subtotal = sum(item.variant.shoe.price * item.quantity for item in cart_items)
-    final_total = subtotal + shipping_fee
-
     context = {
-        'cart_items': cart_items,
-        'total': subtotal,
-        'shipping_fee': shipping_fee,
-        'final_total': final_total,
+        **_totals(cart),
         'customer': customer,
         'addresses': addresses,
         'payment_methods': payment_methods,
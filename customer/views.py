@@ -3,7 +3,7 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
-from models_app.models import Customer, Order, OrderItem, Notification, PaymentMethod, Address
+from models_app.models import Customer, Order, OrderItem, Notification, PaymentMethod, Address, primary_image_prefetch
 from django.urls import reverse, reverse_lazy
 from django.views.decorators.http import require_POST
 from django.contrib import messages
@@ -64,7 +64,8 @@ def order_detail(request, order_id):
 	customer = get_customer_or_redirect_login(request)
 	if not isinstance(customer, Customer):
 		return customer
-	order = get_object_or_404(Order, order_id=order_id, customer=customer)
+	orders = Order.objects.prefetch_related('items__variant__shoe__brand', primary_image_prefetch('items__variant__shoe__images'))
+	order = get_object_or_404(orders, order_id=order_id, customer=customer)
 	return render(request, "customer/order_detail.html", {"order": order, "active": "orders"})
 
 
@@ -11,7 +11,7 @@ class ShoeImageInline(admin.TabularInline):
     model = models.ShoeImage
     extra = 1
     readonly_fields = ()
-    fields = ('image', 'alt_text')
+    fields = ('image', 'alt_text', 'is_primary', 'position')
 
 class ShoeVariantInline(admin.TabularInline):
     model = models.ShoeVariant
@@ -9,6 +9,21 @@ from django.contrib.auth.models import User
 
 # Create your models here.
 
+def primary_image_prefetch(lookup='images'):
+    """Prefetch only the primary image of each shoe reached through ``lookup``.
+
+    The image lands in ``shoe.primary_images`` (a list of at most one), which
+    Shoe.primary_image reads. Use e.g. ``'variant__shoe__images'`` from cart items.
+    """
+    # a sliced prefetch is done with one ROW_NUMBER() window query for all shoes
+    return models.Prefetch(lookup, queryset=ShoeImage.objects.all()[:1], to_attr='primary_images')
+
+
+class ShoeQuerySet(models.QuerySet):
+    def with_primary_image(self):
+        return self.prefetch_related(primary_image_prefetch())
+
+
 class Shoe(models.Model):
     GENDER_CHOICES = {
         'M': 'Men',
@@ -34,6 +49,8 @@ class Shoe(models.Model):
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES, help_text='Target audience (Men/Women/Unisex/Kids).')
     brand = models.ForeignKey('Brand', on_delete=models.SET_NULL, null=True, blank=True, related_name='shoes', help_text='Brand associated with this shoe (optional).')
     discount = models.DecimalField(max_digits=8, decimal_places=2, default=0, help_text='Raw discount amount.')
+
+    objects = ShoeQuerySet.as_manager()
     
     def __str__(self):
         return self.name
@@ -55,19 +72,61 @@ class Shoe(models.Model):
             return self.price + self.discount
         return self.price
 
+    @property
+    def primary_image(self):
+        """The image to show for this shoe, or None.
+
+        Free when loaded with with_primary_image() or prefetched images;
+        otherwise one query.
+        """
+        if hasattr(self, 'primary_images'):
+            return self.primary_images[0] if self.primary_images else None
+        # ShoeImage is ordered primary-first, so this also reads prefetched images
+        return self.images.first()  # type: ignore[attr-defined]
+
+    @property
+    def card(self):
+        """Listing card data; built on the fly if the ShoeListing row is missing."""
+        try:
+            return self.listing  # type: ignore[attr-defined]
+        except ShoeListing.DoesNotExist:
+            return ShoeListing.build(self)
+
     class Meta:
         permissions = [
             ('change_price_only', 'Can change shoe price (price-only)'),
         ]
+        indexes = [
+            # listing sort key, also used as the keyset for cursor pagination
+            models.Index(fields=['price', 'name', 'shoe_id'], name='shoe_listing_order_idx'),
+        ]
     
 class ShoeImage(models.Model):
     shoe = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='images', help_text='Shoe this image belongs to.')
     image = models.ImageField(upload_to='shoe_images/', help_text='Image file for the shoe.')
     alt_text = models.CharField(max_length=255, blank=True, help_text='Alt text for accessibility (optional).')
+    is_primary = models.BooleanField(default=False, help_text='Show this image on cards, carts and orders.')
+    position = models.PositiveIntegerField(default=0, help_text='Display order among the shoe images (lowest first).')
+
+    def save(self, *args, **kwargs):
+        # at most one primary image per shoe
+        if self.is_primary:
+            ShoeImage.objects.filter(shoe_id=self.shoe_id, is_primary=True).exclude(pk=self.pk).update(is_primary=False)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Image for {self.shoe.name}'
 
+    class Meta:
+        # the first image is the primary one, else the lowest position
+        ordering = ['-is_primary', 'position', 'pk']
+        constraints = [
+            models.UniqueConstraint(fields=['shoe'], condition=models.Q(is_primary=True), name='unique_primary_image_per_shoe'),
+        ]
+        indexes = [
+            models.Index(fields=['shoe', '-is_primary', 'position'], name='shoeimage_display_order_idx'),
+        ]
+
 class ShoeVariant(models.Model):
     SIZE_SYSTEM_CHOICES = [
         ('EU', 'European (EU)'),
@@ -111,6 +170,93 @@ class ShoeVariant(models.Model):
         ]
     
     
+class ShoeListing(models.Model):
+    """Denormalized listing card data, one row per shoe (maintained by products.listing)."""
+    shoe = models.OneToOneField(Shoe, on_delete=models.CASCADE, primary_key=True, related_name='listing', help_text='Shoe this listing row describes.')
+    primary_image = models.ImageField(upload_to='shoe_images/', blank=True, help_text='First image of the shoe (blank if none).')
+    price = models.DecimalField(max_digits=8, decimal_places=2, help_text='Effective (discounted) price.')
+    original_price = models.DecimalField(max_digits=8, decimal_places=2, help_text='Price before discount.')
+    is_available = models.BooleanField(default=False, help_text='Whether any variant is available.')
+    total_stock = models.IntegerField(default=0, help_text='Sum of variant stock.')
+    sizes = models.JSONField(default=list, blank=True, help_text='Available sizes, e.g. ["EU 42"].')
+    colors = models.JSONField(default=list, blank=True, help_text='Colours with at least one available variant.')
+    rating_count = models.PositiveIntegerField(default=0, help_text='Number of reviews.')
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, help_text='Average review rating.')
+    updated_at = models.DateTimeField(auto_now=True, help_text='When this row was last rebuilt.')
+
+    @classmethod
+    def build(cls, shoe, rating_count=0, rating_average=None, reserved=None):
+        """Build an unsaved row from the shoe and its (ideally prefetched) primary image and variants.
+
+        ``reserved`` maps variant ids to units held by checkout reservations,
+        which don't count as available.
+        """
+        from products.availability import variant_available
+        reserved = reserved or {}
+        image = shoe.primary_image
+        variants = list(shoe.variants.all())
+        available = [variant for variant in variants if variant_available(variant, reserved.get(variant.pk, 0))]
+        return cls(
+            shoe=shoe,
+            primary_image=image.image.name if image else '',
+            price=shoe.price,
+            original_price=shoe.original_price,
+            is_available=bool(available),
+            total_stock=sum(variant.stock for variant in variants),
+            sizes=sorted({f'{variant.size_system} {variant.size.normalize():f}' for variant in available}),
+            colors=sorted({variant.color for variant in available}),
+            rating_count=rating_count,
+            rating_average=rating_average,
+        )
+
+    def __str__(self):
+        return f'Listing for {self.shoe_id}'
+
+
+class ShoeRating(models.Model):
+    """Review statistics of a shoe, kept up to date on review writes (maintained by products.ratings)."""
+    shoe = models.OneToOneField(Shoe, on_delete=models.CASCADE, primary_key=True, related_name='rating_stats', help_text='Shoe these statistics describe.')
+    count = models.PositiveIntegerField(default=0, help_text='Number of reviews.')
+    total = models.PositiveIntegerField(default=0, help_text='Sum of all ratings.')
+    average = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, help_text='Average rating (empty without reviews).')
+    stars_1 = models.PositiveIntegerField(default=0, help_text='Reviews rated 1.')
+    stars_2 = models.PositiveIntegerField(default=0, help_text='Reviews rated 2.')
+    stars_3 = models.PositiveIntegerField(default=0, help_text='Reviews rated 3.')
+    stars_4 = models.PositiveIntegerField(default=0, help_text='Reviews rated 4.')
+    stars_5 = models.PositiveIntegerField(default=0, help_text='Reviews rated 5.')
+
+    @property
+    def histogram(self):
+        """``[(stars, count, percent)]`` from 5 stars down."""
+        return [
+            (stars, count, round(count * 100 / self.count) if self.count else 0)
+            for stars, count in ((stars, getattr(self, f'stars_{stars}')) for stars in range(5, 0, -1))
+        ]
+
+    def __str__(self):
+        return f'Ratings for {self.shoe_id}'
+
+
+class VariantAvailability(models.Model):
+    """One (shoe, canonical size, colour) combination offered by a shoe (maintained by products.availability)."""
+    shoe = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='availability', help_text='Shoe offering this size and colour.')
+    size = models.DecimalField(max_digits=4, decimal_places=1, help_text='Size on the EU scale, US sizes converted.')
+    color = models.CharField(max_length=50, help_text='Lowercase colour name.')
+    available = models.BooleanField(default=False, help_text='Whether any matching variant can be ordered.')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shoe', 'size', 'color'], name='unique_availability_shoe_size_color'),
+        ]
+        indexes = [
+            models.Index(fields=['available', 'size', 'color'], name='availability_size_idx'),
+            models.Index(fields=['available', 'color'], name='availability_color_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.shoe_id} EU {self.size} {self.color}'
+
+
 class Brand(models.Model):
     name = models.CharField(max_length=100, help_text='Brand name.')
     description = models.TextField(help_text='Short description about the brand.')
@@ -121,6 +267,86 @@ class Brand(models.Model):
     def __str__(self):
         return self.name
      
+class SearchTrigram(models.Model):
+    """Character trigram of one word of a shoe or brand name (maintained by products.fuzzy)."""
+    trigram = models.CharField(max_length=3, help_text='Padded, lowercase character trigram.')
+    word = models.CharField(max_length=100, help_text='Lowercase word the trigram comes from.')
+    word_trigrams = models.PositiveSmallIntegerField(help_text='Number of distinct trigrams in the word.')
+    shoe = models.ForeignKey(Shoe, on_delete=models.CASCADE, null=True, blank=True, related_name='+', help_text='Shoe whose name contains the word.')
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, null=True, blank=True, related_name='+', help_text='Brand whose name contains the word.')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram'], name='searchtrigram_trigram_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.trigram!r} in {self.word}'
+
+
+class ShoePairCount(models.Model):
+    """Number of orders containing both shoes; one row per ordered pair (maintained by products.recommendations)."""
+    shoe = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='+', help_text='Shoe in the order.')
+    other = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='+', help_text='Shoe bought in the same order.')
+    count = models.PositiveIntegerField(default=0, help_text='Orders containing both shoes.')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shoe', 'other'], name='unique_shoe_pair'),
+        ]
+
+    def __str__(self):
+        return f'{self.shoe_id} + {self.other_id}: {self.count}'
+
+
+class ShoeRecommendation(models.Model):
+    """Top "frequently bought together" neighbours of a shoe (maintained by products.recommendations)."""
+    shoe = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='recommendations', help_text='Shoe on whose page the recommendation shows.')
+    recommended = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='+', help_text='Shoe recommended alongside it.')
+    rank = models.PositiveSmallIntegerField(help_text='Position in the list, 1 first.')
+    score = models.PositiveIntegerField(help_text='Orders containing both shoes.')
+
+    class Meta:
+        ordering = ['shoe', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['shoe', 'rank'], name='unique_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.shoe_id} -> {self.recommended_id} (#{self.rank})'
+
+
+class CountedOrder(models.Model):
+    """Order whose shoe pairs are included in ShoePairCount (maintained by products.recommendations)."""
+    order = models.OneToOneField('Order', on_delete=models.CASCADE, primary_key=True, related_name='+', help_text='Order counted.')
+    counted_at = models.DateTimeField(auto_now_add=True, help_text='When its pairs were added.')
+
+    def __str__(self):
+        return f'Order {self.order_id} counted'
+
+
+class RecommendationRun(models.Model):
+    """One run of the co-purchase batch job."""
+    last_order_id = models.PositiveIntegerField(default=0, help_text='Highest order id counted in this run.')
+    orders_processed = models.PositiveIntegerField(default=0, help_text='Orders counted in this run.')
+    shoes_updated = models.PositiveIntegerField(default=0, help_text='Shoes whose recommendations were rebuilt.')
+    finished_at = models.DateTimeField(auto_now_add=True, help_text='When the run finished.')
+
+    def __str__(self):
+        return f'Run up to order {self.last_order_id}'
+
+
+class MerchandisingSnapshot(models.Model):
+    """Precomputed shoe list of one home-page block (maintained by products.merchandising)."""
+    block = models.CharField(max_length=30, unique=True, help_text='Block this list fills, e.g. "bestsellers_7d".')
+    shoe_ids = models.JSONField(default=list, blank=True, help_text='Shoe ids in display order.')
+    computed_at = models.DateTimeField(help_text='When the list was computed.')
+    expires_at = models.DateTimeField(help_text='After this the block is hidden until the next run.')
+
+    def __str__(self):
+        return f'{self.block} ({len(self.shoe_ids)} shoes)'
+
+
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='customer_profile', help_text='Linked Django user account.')
     customer_id = models.AutoField(primary_key=True)
@@ -371,6 +597,20 @@ class Review(models.Model):
     def __str__(self):
         return self.title
 
+class ReviewEligibility(models.Model):
+    """A delivered, not yet reviewed order item: its customer may review its shoe (maintained by products.eligibility)."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+', help_text='Customer who may write the review.')
+    shoe = models.ForeignKey(Shoe, on_delete=models.CASCADE, related_name='+', help_text='Shoe that may be reviewed.')
+    order_item = models.OneToOneField(OrderItem, on_delete=models.CASCADE, related_name='review_eligibility', help_text='Delivered order item the review will refer to.')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'shoe'], name='reviewable_customer_shoe_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.customer_id} may review {self.shoe_id}'
+
 class Admin(models.Model):
     admin_id = models.AutoField(primary_key=True)
     user = models.OneToOneField(
@@ -416,3 +656,24 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.variant} (x{self.quantity})"
+
+
+class StockReservation(models.Model):
+    """Units of a quantity-managed variant held for a customer in checkout (maintained by products.reservations)."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='stock_reservations', help_text='Customer holding the units.')
+    variant = models.ForeignKey(ShoeVariant, on_delete=models.CASCADE, related_name='reservations', help_text='Variant the units are taken from.')
+    quantity = models.PositiveIntegerField(help_text='Units held.')
+    expires_at = models.DateTimeField(help_text='The units are free again after this.')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'variant'], name='unique_reservation_customer_variant'),
+        ]
+        indexes = [
+            # active units per variant: variant = ? AND expires_at > now, summed
+            models.Index(fields=['variant', 'expires_at'], name='reservation_active_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.variant_id} for {self.customer_id} until {self.expires_at}'
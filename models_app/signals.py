@@ -6,6 +6,15 @@ from django.core.exceptions import ValidationError
 
 from .models import Order, OrderItem, ShoeVariant
 
+
+def _stock_changed(shoe_ids):
+    # queryset .update() skips model signals, so refresh derived catalog data here
+    from products import availability, listing, variants
+    listing.schedule_refresh(shoe_ids)
+    availability.schedule_refresh(shoe_ids)
+    variants.invalidate(shoe_ids)
+
+
 @receiver(post_save, sender=OrderItem)
 def orderitem_post_save(sender, instance, created, **kwargs):
     if not created:
@@ -19,15 +28,21 @@ def orderitem_post_save(sender, instance, created, **kwargs):
     if order_status != 'pending':
         return
 
+    from products import reservations
+
     # Equivalent to BEGIN TRANSACTION
     with transaction.atomic():
         variant = ShoeVariant.objects.select_for_update().get(pk=instance.variant.pk)
 
         # Check stock based on management method
         if variant.stock_management == 'quantity':
-            if variant.stock < instance.quantity:
-                raise ValidationError(f"Insufficient stock for {variant}. Available {variant.stock}, requested {instance.quantity}.")
+            # units other customers hold in checkout are not for sale
+            held = reservations.reserved_quantities([variant.pk], exclude_customer_id=instance.order.customer_id)
+            available = variant.stock - held.get(variant.pk, 0)
+            if available < instance.quantity:
+                raise ValidationError(f"Insufficient stock for {variant}. Available {available}, requested {instance.quantity}.")
             ShoeVariant.objects.filter(pk=variant.pk).update(stock=F('stock') - instance.quantity)
+            _stock_changed([variant.shoe_id])
         elif variant.stock_management == 'boolean':
             if not variant.in_stock:
                 raise ValidationError(f"Item {variant} is out of stock.")
@@ -37,10 +52,13 @@ def orderitem_post_save(sender, instance, created, **kwargs):
             if variant.stock < instance.quantity:
                 raise ValidationError(f"Insufficient stock for {variant}. Available {variant.stock}, requested {instance.quantity}.")
             ShoeVariant.objects.filter(pk=variant.pk).update(stock=F('stock') - instance.quantity)
+            _stock_changed([variant.shoe_id])
 
 
 @receiver(pre_save, sender=Order)
 def order_pre_save(sender, instance, **kwargs):
+    # read by order_post_save once the new status is written
+    instance._previous_status = None
     if not instance.pk:
         return
 
@@ -54,12 +72,31 @@ def order_pre_save(sender, instance, **kwargs):
 
     if old_status == new_status:
         return
+    instance._previous_status = old_status
 
     # pending -> cancelled: restock items
     if old_status == 'pending' and new_status == 'cancelled':
         with transaction.atomic():
+            restocked = set()
             for item in old.items.select_related('variant').all():
                 ShoeVariant.objects.filter(pk=item.variant.pk).update(stock=F('stock') + item.quantity)
+                restocked.add(item.variant.shoe_id)
+            _stock_changed(restocked)
+
+
+@receiver(post_save, sender=Order)
+def order_post_save(sender, instance, created, **kwargs):
+    old_status = getattr(instance, '_previous_status', None)
+    if old_status is None:
+        return
+    instance._previous_status = None
+
+    # after the row is written, so hooks deferring to on_commit never run
+    # ahead of the status change when there is no surrounding transaction
+    from products import eligibility, recommendations
+    new_status = (instance.status or '').lower()
+    eligibility.order_status_changed(instance.pk, old_status, new_status)
+    recommendations.order_status_changed(instance.pk, old_status, new_status)
 
 
 @receiver(post_delete, sender=OrderItem)
@@ -0,0 +1,105 @@
+"""Maintenance of the VariantAvailability index behind the size and colour filters.
+
+Each shoe gets one row per (canonical size, colour) it is made in, flagged
+available when any matching variant can be ordered. Sizes are put on the EU
+scale so "42" matches both EU 42 and US 9 variants, and the size/colour
+filters become a single indexed lookup instead of a join over ShoeVariant.
+Units held by checkout reservations (products.reservations) don't count as
+available.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+
+from models_app.models import Shoe, VariantAvailability
+from . import catalog_cache, reservations
+
+SIZE_STEP = Decimal('0.5')
+# EU size is roughly US size plus this offset; women's US sizes run two higher
+US_TO_EU_OFFSET = {'W': Decimal('31')}
+DEFAULT_US_TO_EU_OFFSET = Decimal('33')
+
+
+def canonical_size(size_system, size, gender=None):
+    """EU size for a variant size, rounded to the nearest half size."""
+    size = Decimal(size)
+    if size_system == 'US':
+        size += US_TO_EU_OFFSET.get(gender, DEFAULT_US_TO_EU_OFFSET)
+    return ((size / SIZE_STEP).quantize(Decimal('1'), rounding=ROUND_HALF_UP) * SIZE_STEP).quantize(Decimal('0.1'))
+
+
+def normalize_color(color):
+    return ' '.join(color.split()).lower()
+
+
+def variant_available(variant, reserved=0):
+    # the checkbox always applies; quantity-managed variants also need units nobody has reserved
+    if not variant.in_stock:
+        return False
+    return variant.stock_management != 'quantity' or variant.stock - reserved > 0
+
+
+def _rows(shoe, reserved):
+    combos = {}
+    for variant in shoe.variants.all():
+        key = (canonical_size(variant.size_system, variant.size, shoe.gender), normalize_color(variant.color))
+        combos[key] = combos.get(key, False) or variant_available(variant, reserved.get(variant.pk, 0))
+    return [
+        VariantAvailability(shoe=shoe, size=size, color=color, available=available)
+        for (size, color), available in combos.items()
+    ]
+
+
+def refresh_availability(shoe_ids):
+    """Recompute the availability rows of the given shoes. Returns the number of shoes processed."""
+    shoe_ids = list(shoe_ids)
+    if not shoe_ids:
+        return 0
+    shoes = list(Shoe.objects.filter(pk__in=shoe_ids).prefetch_related('variants'))
+    reserved = reservations.reserved_quantities([variant.pk for shoe in shoes for variant in shoe.variants.all()])
+    rows = [row for shoe in shoes for row in _rows(shoe, reserved)]
+    with transaction.atomic():
+        VariantAvailability.objects.filter(shoe_id__in=shoe_ids).delete()
+        VariantAvailability.objects.bulk_create(rows)
+    return len(shoes)
+
+
+def schedule_refresh(shoe_ids):
+    """Refresh after the current transaction commits, then expire stock-dependent caches.
+
+    Only entries keyed on the availability version (size and colour filter
+    results, the dropdown options) are expired; the rest of the catalog cache
+    survives stock changes.
+    """
+    shoe_ids = set(shoe_ids)
+    if not shoe_ids:
+        return
+
+    def refresh():
+        refresh_availability(shoe_ids)
+        catalog_cache.bump_availability_version()
+
+    transaction.on_commit(refresh)
+
+
+def rebuild_availability(batch_size=200):
+    """Rebuild the whole index. Returns the number of shoes processed."""
+    shoe_ids = list(Shoe.objects.order_by('pk').values_list('pk', flat=True))
+    count = 0
+    for start in range(0, len(shoe_ids), batch_size):
+        count += refresh_availability(shoe_ids[start:start + batch_size])
+    return count
+
+
+def size_options():
+    """Sizes with at least one available variant, smallest first."""
+    return list(
+        VariantAvailability.objects.filter(available=True).order_by('size').values_list('size', flat=True).distinct()
+    )
+
+
+def color_options():
+    """Colours with at least one available variant, alphabetically."""
+    return list(
+        VariantAvailability.objects.filter(available=True).order_by('color').values_list('color', flat=True).distinct()
+    )
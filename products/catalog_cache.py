@@ -0,0 +1,203 @@
+"""Cache helpers for data derived from the catalog.
+
+Cached entries embed the current catalog version in their key. Saving or
+deleting catalog rows bumps the version, so stale entries are never read
+again and simply age out of the cache.
+
+Stock and reservation changes don't touch the catalog version: they bump a
+separate availability version, which only entries that depend on what is in
+stock (size and colour filters, the size and colour dropdowns) embed as well.
+
+A third, names version changes only when a shoe or brand is added, renamed
+or removed, for indexes built from names alone (search suggestions).
+
+Data about a single shoe is keyed on that shoe's own version instead, so a
+stock change on one shoe leaves every other shoe's entries alone. A shoe
+version is the time of its last change in nanoseconds.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+VERSION_KEY = 'products:catalog_version'
+AVAILABILITY_VERSION_KEY = 'products:availability_version'
+NAMES_VERSION_KEY = 'products:names_version'
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # seed from the clock so a version lost to eviction never repeats an old one
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def catalog_version():
+    return _version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump(VERSION_KEY)
+
+
+def availability_version():
+    return _version(AVAILABILITY_VERSION_KEY)
+
+
+def bump_availability_version():
+    _bump(AVAILABILITY_VERSION_KEY)
+
+
+def names_version():
+    return _version(NAMES_VERSION_KEY)
+
+
+def bump_names_version():
+    _bump(NAMES_VERSION_KEY)
+
+
+def _shoe_version_key(shoe_id):
+    return f'products:shoe_version:{shoe_id}'
+
+
+def shoe_version(shoe_id):
+    key = _shoe_version_key(shoe_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def shoe_versions(shoe_ids):
+    """``{shoe_id: version}`` for several shoes in one cache round trip."""
+    keys = {_shoe_version_key(shoe_id): shoe_id for shoe_id in shoe_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    missing = [shoe_id for shoe_id in keys.values() if shoe_id not in versions]
+    for shoe_id in missing:
+        versions[shoe_id] = shoe_version(shoe_id)
+    return versions
+
+
+def bump_shoe_versions(shoe_ids):
+    now = time.time_ns()
+    cache.set_many({_shoe_version_key(shoe_id): now for shoe_id in shoe_ids}, None)
+
+
+def params_digest(params):
+    """Stable digest of a dict of (already normalized) parameters."""
+    encoded = urlencode(sorted((key, str(value)) for key, value in params.items()))
+    return hashlib.md5(encoded.encode()).hexdigest()
+
+
+def make_key(prefix, params=None, availability=False):
+    key = f'products:{prefix}:{catalog_version()}'
+    if availability:
+        key = f'{key}:a{availability_version()}'
+    if params is not None:
+        key = f'{key}:{params_digest(params)}'
+    return key
+
+
+def make_shoe_key(prefix, shoe_id, version=None):
+    if version is None:
+        version = shoe_version(shoe_id)
+    return f'products:{prefix}:shoe:{shoe_id}:{version}'
+
+
+# prefixes cached through get_or_compute(_for_shoe), reported by the catalog_cache_stats command
+TRACKED_PREFIXES = ('listing_ids', 'brands', 'facets', 'variant_options', 'variant_matrix', 'category_samples')
+
+_MISSING = object()
+
+
+def _stats_key(prefix, outcome):
+    return f'products:stats:{prefix}:{outcome}'
+
+
+def _record(prefix, outcome):
+    key = _stats_key(prefix, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add() and incr(); losing one sample is fine
+            pass
+
+
+def _get_or_compute(prefix, key, compute, timeout):
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        _record(prefix, 'misses')
+        value = compute()
+        cache.set(key, value, timeout)
+    else:
+        _record(prefix, 'hits')
+    return value
+
+
+def get_or_compute(prefix, params, compute, timeout, availability=False):
+    """Return the cached value for (prefix, params), computing and storing it on a miss.
+
+    Pass ``availability=True`` when the value depends on stock, so that it also
+    expires with the availability version.
+    """
+    return _get_or_compute(prefix, make_key(prefix, params, availability), compute, timeout)
+
+
+def get_or_compute_for_shoe(prefix, shoe_id, compute, timeout):
+    """Like get_or_compute, but keyed on one shoe's version rather than the catalog's."""
+    return _get_or_compute(prefix, make_shoe_key(prefix, shoe_id), compute, timeout)
+
+
+def get_many_for_shoes(prefix, shoe_ids, compute_many, timeout):
+    """Bulk get_or_compute_for_shoe: ``compute_many(missing_ids)`` returns ``{shoe_id: value}``.
+
+    Ids missing from that dict are left out of the result and not cached.
+    """
+    versions = shoe_versions(shoe_ids)
+    keys = {make_shoe_key(prefix, shoe_id, version): shoe_id for shoe_id, version in versions.items()}
+    found = cache.get_many(keys)
+    values = {keys[key]: value for key, value in found.items()}
+    missing = [shoe_id for shoe_id in versions if shoe_id not in values]
+    for _ in values:
+        _record(prefix, 'hits')
+    if missing:
+        for _ in missing:
+            _record(prefix, 'misses')
+        computed = compute_many(missing)
+        cache.set_many(
+            {make_shoe_key(prefix, shoe_id, versions[shoe_id]): value for shoe_id, value in computed.items()},
+            timeout,
+        )
+        values.update(computed)
+    return values
+
+
+def stats(prefixes=TRACKED_PREFIXES):
+    """Hit/miss counters per prefix, as seen by this cache backend."""
+    keys = {
+        (prefix, outcome): _stats_key(prefix, outcome)
+        for prefix in prefixes
+        for outcome in ('hits', 'misses')
+    }
+    values = cache.get_many(keys.values())
+    return {
+        prefix: {outcome: values.get(keys[(prefix, outcome)], 0) for outcome in ('hits', 'misses')}
+        for prefix in prefixes
+    }
+
+
+def reset_stats(prefixes=TRACKED_PREFIXES):
+    cache.delete_many([_stats_key(prefix, outcome) for prefix in prefixes for outcome in ('hits', 'misses')])
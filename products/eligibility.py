@@ -0,0 +1,72 @@
+"""Maintenance of the ReviewEligibility set.
+
+A customer may review a shoe while they have a delivered order item for it
+that has no review yet; each such item is one ReviewEligibility row. Rows
+are added when an order becomes Delivered or a review is deleted, and
+removed when a review is written or an order leaves Delivered, so the review
+pages answer "may this customer review this shoe?" with one indexed lookup.
+"""
+from django.db import transaction
+
+from models_app.models import OrderItem, ReviewEligibility
+
+
+def _grant(items):
+    ReviewEligibility.objects.bulk_create(
+        [
+            ReviewEligibility(customer_id=customer_id, shoe_id=shoe_id, order_item_id=item_id)
+            for item_id, customer_id, shoe_id in items.values_list('pk', 'order__customer_id', 'variant__shoe_id')
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def grant_order(order_id):
+    """Make the unreviewed items of a delivered order reviewable."""
+    _grant(OrderItem.objects.filter(order_id=order_id, review__isnull=True))
+
+
+def revoke_order(order_id):
+    ReviewEligibility.objects.filter(order_item__order_id=order_id).delete()
+
+
+def order_status_changed(order_id, old_status, new_status):
+    """Called with lowercase statuses when an order changes status; applies after commit."""
+    if new_status == 'delivered':
+        transaction.on_commit(lambda: grant_order(order_id))
+    elif old_status == 'delivered':
+        transaction.on_commit(lambda: revoke_order(order_id))
+
+
+def review_written(order_item_id):
+    ReviewEligibility.objects.filter(order_item_id=order_item_id).delete()
+
+
+def review_removed(order_item_id):
+    # after commit: when the order item itself is being deleted, it is gone by then
+    transaction.on_commit(lambda: _grant(
+        OrderItem.objects.filter(pk=order_item_id, order__status__iexact='delivered', review__isnull=True)
+    ))
+
+
+def reviewable_item(customer, shoe):
+    """The most recently delivered unreviewed order item of ``shoe`` for ``customer``, or None."""
+    eligibility = (
+        ReviewEligibility.objects.filter(customer=customer, shoe=shoe)
+        .select_related('order_item__order', 'order_item__variant')
+        .order_by('-order_item__order__delivery_date', '-order_item__order__order_date', '-order_item_id')
+        .first()
+    )
+    return eligibility.order_item if eligibility else None
+
+
+def can_review(customer, shoe):
+    return ReviewEligibility.objects.filter(customer=customer, shoe=shoe).exists()
+
+
+def rebuild():
+    """Recompute the whole set from orders and reviews. Returns the number of reviewable items."""
+    with transaction.atomic():
+        ReviewEligibility.objects.all().delete()
+        _grant(OrderItem.objects.filter(order__status__iexact='delivered', review__isnull=True))
+    return ReviewEligibility.objects.count()
@@ -0,0 +1,104 @@
+"""Facet counts for the catalog listing filters.
+
+All counts come from one grouped query over (category, brand, gender, price
+bucket). Category, brand and gender counts ignore their own selection, so the
+dropdowns keep showing how many shoes each alternative would return; price
+bucket counts honour every filter. Results are cached per normalized filter
+set and catalog version (and availability version, under size or colour
+filters).
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from models_app.models import Shoe
+from . import catalog_cache
+from .filters import filter_shoes, uses_stock
+
+# (lower, upper] price ranges; None leaves a side open
+PRICE_BUCKETS = (
+    (None, Decimal('2000')),
+    (Decimal('2000'), Decimal('5000')),
+    (Decimal('5000'), Decimal('10000')),
+    (Decimal('10000'), None),
+)
+
+FACET_FIELDS = ('category', 'brand', 'gender')
+FACET_TIMEOUT = 60 * 10
+
+
+def _price_bucket():
+    whens = [
+        When(price__lte=upper, then=Value(index))
+        for index, (lower, upper) in enumerate(PRICE_BUCKETS)
+        if upper is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def _compute(filters):
+    base_filters = {key: value for key, value in filters.items() if key not in FACET_FIELDS}
+    rows = (
+        filter_shoes(Shoe.objects.all(), base_filters)
+        .order_by()
+        .annotate(price_bucket=_price_bucket())
+        .values('category', 'brand_id', 'gender', 'price_bucket')
+        .annotate(count=Count('pk'))
+    )
+
+    selected = {field: filters.get(field) for field in FACET_FIELDS}
+    counts = {field: {} for field in FACET_FIELDS}
+    counts['price'] = [0] * len(PRICE_BUCKETS)
+
+    def matches(values, fields):
+        return all(selected[field] is None or values[field] == selected[field] for field in fields)
+
+    for row in rows:
+        values = {'category': row['category'], 'brand': row['brand_id'], 'gender': row['gender']}
+        for field in FACET_FIELDS:
+            others = [other for other in FACET_FIELDS if other != field]
+            if matches(values, others):
+                counts[field][values[field]] = counts[field].get(values[field], 0) + row['count']
+        if matches(values, FACET_FIELDS):
+            counts['price'][row['price_bucket']] += row['count']
+    return counts
+
+
+def facet_counts(filters):
+    """Return ``{'category': {code: n}, 'brand': {id: n}, 'gender': {code: n}, 'price': [n, ...]}``."""
+    return catalog_cache.get_or_compute(
+        'facets', filters, lambda: _compute(filters), FACET_TIMEOUT, availability=uses_stock(filters)
+    )
+
+
+def choice_options(choices, counts):
+    """Pair a {value: label} mapping with its counts for a dropdown."""
+    return [
+        {'value': value, 'label': label, 'count': counts.get(value, 0)}
+        for value, label in choices.items()
+    ]
+
+
+def brand_options(brands, counts):
+    return [
+        {'value': brand.brand_id, 'label': brand.name, 'count': counts.get(brand.brand_id, 0)}
+        for brand in brands
+    ]
+
+
+def price_options(counts, params):
+    """Price bucket links; ``params`` is a mutable copy of the current GET parameters."""
+    params.pop('page', None)
+    options = []
+    for (lower, upper), count in zip(PRICE_BUCKETS, counts):
+        # prices have two decimals, so (lower, upper] is [lower + 0.01, upper]
+        params['min_price'] = str(lower + Decimal('0.01')) if lower is not None else ''
+        params['max_price'] = str(upper) if upper is not None else ''
+        if lower is None:
+            label = f'Up to KSh {upper:,.0f}'
+        elif upper is None:
+            label = f'Over KSh {lower:,.0f}'
+        else:
+            label = f'KSh {lower:,.0f} – {upper:,.0f}'
+        options.append({'label': label, 'count': count, 'query': params.urlencode()})
+    return options
@@ -0,0 +1,150 @@
+"""Parsing and applying the catalog listing filters.
+
+``normalize_filters`` turns request parameters into a dict holding only the
+filters that are set and valid, with canonical types and casing, so equal
+filter sets produce equal dicts (and equal cache keys).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from models_app.models import Shoe, VariantAvailability
+from . import availability, fuzzy, search
+
+PRICE_STEP = Decimal('0.01')
+# filters answered from the availability index, whose results change with stock
+STOCK_FILTERS = ('size', 'color')
+
+
+def _price(value):
+    try:
+        price = Decimal(value.strip())
+    except (InvalidOperation, AttributeError):
+        return None
+    if not price.is_finite() or price < 0:
+        return None
+    return price.quantize(PRICE_STEP)
+
+
+def normalize_filters(params):
+    filters = {}
+
+    q = ' '.join(params.get('q', '').split())
+    if q:
+        filters['q'] = q.lower()
+
+    category = params.get('category', '').strip().lower()
+    if category:
+        filters['category'] = category
+
+    brand = params.get('brand', '').strip()
+    if brand.isdigit():
+        filters['brand'] = int(brand)
+
+    gender = params.get('gender', '').strip().upper()
+    if gender:
+        filters['gender'] = gender
+
+    for field in ('min_price', 'max_price'):
+        price = _price(params.get(field, ''))
+        if price is not None:
+            filters[field] = price
+
+    # sizes are on the EU scale, as stored in the availability index
+    size = _price(params.get('size', ''))
+    if size:
+        filters['size'] = availability.canonical_size('EU', size)
+
+    color = availability.normalize_color(params.get('color', ''))
+    if color:
+        filters['color'] = color
+
+    min_rating = params.get('min_rating', '').strip()
+    if min_rating in ('1', '2', '3', '4', '5'):
+        filters['min_rating'] = int(min_rating)
+
+    return filters
+
+
+def keyword_shoe_ids(q, limit=None):
+    """Shoe ids matching a keyword query, most relevant first.
+
+    Padded with fuzzy matches when exact search finds too few.
+    """
+    # ranked full-text lookup; icontains only where the DB has no FTS backend
+    shoe_ids = search.search_shoe_ids(q, limit=limit)
+    if shoe_ids is None:
+        shoe_ids = list(
+            Shoe.objects.filter(Q(name__icontains=q) | Q(description__icontains=q)).values_list('pk', flat=True)
+        )
+    if len(shoe_ids) < fuzzy.MIN_EXACT_HITS:
+        exact = set(shoe_ids)
+        shoe_ids += [shoe_id for shoe_id in fuzzy.similar_shoe_ids(q) if shoe_id not in exact]
+    return shoe_ids
+
+
+def keyword_filter(q):
+    """A Shoe filter for a keyword query, unranked.
+
+    Matches stay a subquery on the search index unless exact search finds
+    too few, in which case the handful of hits is padded with fuzzy matches.
+    """
+    exact = search.match_filter(q)
+    if exact is None:
+        exact = Q(name__icontains=q) | Q(description__icontains=q)
+    hits = list(Shoe.objects.filter(exact).values_list('pk', flat=True)[:fuzzy.MIN_EXACT_HITS])
+    if len(hits) >= fuzzy.MIN_EXACT_HITS:
+        return exact
+    return Q(pk__in=hits + [shoe_id for shoe_id in fuzzy.similar_shoe_ids(q) if shoe_id not in hits])
+
+
+def filter_shoes(qs, filters):
+    """Apply normalized filters to a Shoe queryset."""
+    q = filters.get('q')
+    if q:
+        qs = qs.filter(keyword_filter(q))
+
+    if 'category' in filters:
+        qs = qs.filter(category=filters['category'])
+
+    if 'brand' in filters:
+        qs = qs.filter(brand_id=filters['brand'])
+
+    if 'gender' in filters:
+        qs = qs.filter(gender=filters['gender'])
+
+    if 'min_price' in filters:
+        qs = qs.filter(price__gte=filters['min_price'])
+
+    if 'max_price' in filters:
+        qs = qs.filter(price__lte=filters['max_price'])
+
+    if 'min_rating' in filters:
+        qs = qs.filter(rating_stats__average__gte=filters['min_rating'])
+
+    # one semi-join on the availability index; a shoe matches once however many variants fit
+    stocked = {field: filters[field] for field in STOCK_FILTERS if field in filters}
+    if stocked:
+        qs = qs.filter(pk__in=VariantAvailability.objects.filter(available=True, **stocked).values('shoe_id'))
+
+    return qs
+
+
+def uses_stock(filters):
+    """Whether results for these filters depend on stock (and expire with the availability version)."""
+    return any(field in filters for field in STOCK_FILTERS)
+
+
+def ranked_shoe_ids(filters, limit=None):
+    """Ids of shoes matching ``filters`` (which must include 'q'), most relevant first.
+
+    Only the ``limit`` best keyword matches are considered; the other filters
+    then narrow that list without changing its order. Unranked listings use
+    ``filter_shoes``, which keeps the matches in the database.
+    """
+    ranked = keyword_shoe_ids(filters['q'], limit=limit)
+    others = {key: value for key, value in filters.items() if key != 'q'}
+    if not others:
+        return ranked
+    matching = set(filter_shoes(Shoe.objects.filter(pk__in=ranked), others).values_list('pk', flat=True))
+    return [shoe_id for shoe_id in ranked if shoe_id in matching]
@@ -0,0 +1,108 @@
+"""Typo-tolerant matching on a character-trigram index.
+
+Every word of every shoe and brand name is stored as its set of padded
+trigrams (the scheme pg_trgm uses: "nike" -> "  n", " ni", "nik", "ike",
+"ke "). A misspelled query word is scored against indexed words by trigram
+similarity, shared / (query + word - shared), so "addidas" still finds
+"adidas". The listing only falls back to this when exact search returns
+fewer than MIN_EXACT_HITS shoes.
+"""
+from collections import defaultdict
+
+from models_app.models import Brand, SearchTrigram, Shoe
+from .search import tokenize
+
+SIMILARITY_THRESHOLD = 0.3
+MIN_EXACT_HITS = 3
+MAX_RESULTS = 50
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _rows(text, **owner):
+    rows = []
+    for word in set(tokenize(text)):
+        word = word[:100]
+        grams = trigrams(word)
+        rows.extend(
+            SearchTrigram(trigram=gram, word=word, word_trigrams=len(grams), **owner)
+            for gram in grams
+        )
+    return rows
+
+
+def index_shoe(shoe):
+    SearchTrigram.objects.filter(shoe=shoe).delete()
+    SearchTrigram.objects.bulk_create(_rows(shoe.name, shoe=shoe))
+
+
+def index_brand(brand):
+    SearchTrigram.objects.filter(brand=brand).delete()
+    SearchTrigram.objects.bulk_create(_rows(brand.name, brand=brand))
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild the whole trigram index. Returns the number of rows written."""
+    SearchTrigram.objects.all().delete()
+    rows = []
+    for shoe in Shoe.objects.only('shoe_id', 'name').iterator():
+        rows.extend(_rows(shoe.name, shoe=shoe))
+    for brand in Brand.objects.only('brand_id', 'name').iterator():
+        rows.extend(_rows(brand.name, brand=brand))
+    SearchTrigram.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def similar_shoe_ids(query, threshold=SIMILARITY_THRESHOLD, limit=MAX_RESULTS):
+    """Shoe ids whose name (or brand name) resembles every word of ``query``, best first."""
+    words = {word: trigrams(word) for word in set(tokenize(query))}
+    if not words:
+        return []
+    all_grams = set().union(*words.values())
+
+    # shared trigram counts per indexed (owner, word), per query word
+    shared = defaultdict(lambda: defaultdict(int))
+    sizes = {}
+    rows = SearchTrigram.objects.filter(trigram__in=all_grams).values_list(
+        'shoe_id', 'brand_id', 'word', 'word_trigrams', 'trigram'
+    )
+    for shoe_id, brand_id, word, word_trigrams, gram in rows:
+        owner = ('shoe', shoe_id) if shoe_id else ('brand', brand_id)
+        sizes[(owner, word)] = word_trigrams
+        for query_word, query_grams in words.items():
+            if gram in query_grams:
+                shared[(owner, word)][query_word] += 1
+
+    # best similarity per owner and query word
+    best = defaultdict(dict)
+    for key, counts in shared.items():
+        owner, _ = key
+        for query_word, count in counts.items():
+            similarity = count / (len(words[query_word]) + sizes[key] - count)
+            if similarity >= threshold and similarity > best[owner].get(query_word, 0):
+                best[owner][query_word] = similarity
+
+    brand_ids = [owner_id for (kind, owner_id) in best if kind == 'brand']
+    shoes_by_brand = defaultdict(list)
+    for shoe_id, brand_id in Shoe.objects.filter(brand_id__in=brand_ids).values_list('shoe_id', 'brand_id'):
+        shoes_by_brand[brand_id].append(shoe_id)
+
+    # a shoe matches a query word through its own name or its brand's name
+    scores = defaultdict(dict)
+    for (kind, owner_id), matches in best.items():
+        shoe_ids = [owner_id] if kind == 'shoe' else shoes_by_brand[owner_id]
+        for shoe_id in shoe_ids:
+            for query_word, similarity in matches.items():
+                if similarity > scores[shoe_id].get(query_word, 0):
+                    scores[shoe_id][query_word] = similarity
+
+    ranked = [
+        (sum(matches.values()) / len(words), shoe_id)
+        for shoe_id, matches in scores.items()
+        if len(matches) == len(words)
+    ]
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return [shoe_id for _, shoe_id in ranked[:limit]]
@@ -0,0 +1,63 @@
+"""Maintenance of the ShoeListing read-model.
+
+Listing pages take their card data (primary image, prices, availability,
+sizes, colours and rating summary) from one ShoeListing row per shoe instead
+of walking each shoe's images, variants and reviews. Signals schedule a
+refresh whenever one of those changes, and so do checkout reservations that
+make a variant (un)available.
+"""
+from django.db import transaction
+
+from models_app.models import Shoe, ShoeListing, ShoeRating
+from . import reservations
+
+UPDATE_FIELDS = [
+    'primary_image', 'price', 'original_price', 'is_available', 'total_stock',
+    'sizes', 'colors', 'rating_count', 'rating_average', 'updated_at',
+]
+
+
+def _ratings(shoe_ids):
+    # copied from the ShoeRating statistics rather than aggregated over reviews
+    rows = ShoeRating.objects.filter(shoe_id__in=shoe_ids).values_list('shoe_id', 'count', 'average')
+    return {shoe_id: (count, average) for shoe_id, count, average in rows}
+
+
+def refresh_listings(shoe_ids):
+    """Recompute the listing rows of the given shoes. Returns the number written."""
+    shoe_ids = list(shoe_ids)
+    if not shoe_ids:
+        return 0
+    shoes = Shoe.objects.filter(pk__in=shoe_ids).with_primary_image().prefetch_related('variants')
+    ratings = _ratings(shoe_ids)
+    reserved = reservations.reserved_quantities(
+        [variant.pk for shoe in shoes for variant in shoe.variants.all()]
+    )
+    rows = [ShoeListing.build(shoe, *ratings.get(shoe.pk, (0, None)), reserved=reserved) for shoe in shoes]
+    ShoeListing.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['shoe'],
+        update_fields=UPDATE_FIELDS,
+    )
+    return len(rows)
+
+
+def schedule_refresh(shoe_ids):
+    """Refresh after the current transaction commits.
+
+    Deferring means a cascade delete of a shoe (which deletes its variants and
+    images first) finds the shoe gone instead of re-creating its row.
+    """
+    shoe_ids = set(shoe_ids)
+    if shoe_ids:
+        transaction.on_commit(lambda: refresh_listings(shoe_ids))
+
+
+def rebuild_listings(batch_size=200):
+    """Rebuild every listing row. Returns the number of shoes processed."""
+    shoe_ids = list(Shoe.objects.order_by('pk').values_list('pk', flat=True))
+    count = 0
+    for start in range(0, len(shoe_ids), batch_size):
+        count += refresh_listings(shoe_ids[start:start + batch_size])
+    return count
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from products import merchandising
+
+
+class Command(BaseCommand):
+    help = 'Recompute the home page merchandising blocks (new arrivals, bestsellers, biggest discounts).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=merchandising.BLOCK_SIZE, help='Shoes kept per block.')
+        parser.add_argument(
+            '--ttl-hours', type=float, default=merchandising.SNAPSHOT_TTL.total_seconds() / 3600,
+            help='Hours before a block is hidden if it has not been rebuilt.',
+        )
+
+    def handle(self, *args, **options):
+        blocks = merchandising.build_snapshots(size=options['size'], ttl=timedelta(hours=options['ttl_hours']))
+        summary = ', '.join(f'{block}: {len(shoe_ids)}' for block, shoe_ids in blocks.items())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt merchandising snapshots ({summary}).'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Count co-purchases in orders not counted yet and refresh "frequently bought together" lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=recommendations.TOP_N, help='Recommendations kept per shoe.')
+        parser.add_argument('--full', action='store_true', help='Discard all counts and recount every order.')
+
+    def handle(self, *args, **options):
+        run = recommendations.update_recommendations(top_n=options['top'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {run.orders_processed} new orders; '
+            f'updated recommendations for {run.shoes_updated} shoes.'
+        ))
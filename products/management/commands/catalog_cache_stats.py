@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from products import catalog_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the catalog result caches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Catalog version: {catalog_cache.catalog_version()}')
+        self.stdout.write(f'Availability version: {catalog_cache.availability_version()}')
+        for prefix, counts in catalog_cache.stats().items():
+            total = counts['hits'] + counts['misses']
+            ratio = counts['hits'] / total * 100 if total else 0
+            self.stdout.write(f"{prefix:<12} hits={counts['hits']:<8} misses={counts['misses']:<8} hit rate={ratio:.1f}%")
+        if options['reset']:
+            catalog_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products import availability
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the size/colour availability index for all shoes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Shoes refreshed per batch.')
+
+    def handle(self, *args, **options):
+        count = availability.rebuild_availability(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt availability for {count} shoes.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products import listing
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ShoeListing read-model for all shoes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Shoes refreshed per batch.')
+
+    def handle(self, *args, **options):
+        count = listing.rebuild_listings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} listing rows.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import eligibility
+
+
+class Command(BaseCommand):
+    help = 'Recompute which delivered order items can still be reviewed.'
+
+    def handle(self, *args, **options):
+        count = eligibility.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{count} order items can be reviewed.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all shoes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per batch.')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('No full-text backend for this database; search uses icontains.'))
+            return
+        count = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} shoes.'))
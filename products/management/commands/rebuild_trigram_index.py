@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products import fuzzy
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the trigram index used for typo-tolerant search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted per batch.')
+
+    def handle(self, *args, **options):
+        count = fuzzy.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} trigram rows.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from products import listing, ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-shoe rating statistics from the Review table.'
+
+    def handle(self, *args, **options):
+        changed = ratings.reconcile()
+        listing.refresh_listings(changed)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled ratings; {len(changed)} shoes corrected.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock reservations and refresh the availability they affected.'
+
+    def handle(self, *args, **options):
+        count = reservations.sweep()
+        self.stdout.write(self.style.SUCCESS(f'Released {count} expired reservations.'))
@@ -0,0 +1,107 @@
+"""Precomputed merchandising blocks for the home page.
+
+build_snapshots() runs the aggregations over orders and discounts on a
+schedule and stores each block as an ordered list of shoe ids in
+MerchandisingSnapshot. The home page then reads the snapshots and the listed
+shoes by primary key, with no aggregation on the request path. A snapshot
+past its expiry is not shown, so a stalled job hides stale blocks instead of
+showing them forever.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from models_app.models import MerchandisingSnapshot, OrderItem, Shoe
+
+BLOCK_SIZE = 8
+SNAPSHOT_TTL = timedelta(hours=24)
+BESTSELLER_WINDOWS = {'bestsellers_7d': 7, 'bestsellers_30d': 30}
+BLOCK_TITLES = {
+    'new_arrivals': 'New arrivals',
+    'bestsellers_7d': 'Bestsellers this week',
+    'bestsellers_30d': 'Bestsellers this month',
+    'on_sale': 'Biggest discounts',
+}
+
+
+def _available_shoes():
+    return Shoe.objects.filter(listing__is_available=True)
+
+
+def new_arrivals(size=BLOCK_SIZE):
+    # shoes have no creation date; ids are assigned in the order shoes are added
+    return list(_available_shoes().order_by('-shoe_id').values_list('shoe_id', flat=True)[:size])
+
+
+def bestsellers(days, size=BLOCK_SIZE):
+    """Available shoes with the most units sold in orders of the last ``days`` days."""
+    since = timezone.localdate() - timedelta(days=days)
+    rows = (
+        OrderItem.objects.filter(order__order_date__gte=since, variant__shoe__listing__is_available=True)
+        .exclude(order__status__iexact='cancelled')
+        .values('variant__shoe_id')
+        .annotate(units=Sum('quantity'))
+        .order_by('-units', 'variant__shoe_id')
+        .values_list('variant__shoe_id', flat=True)[:size]
+    )
+    return list(rows)
+
+
+def biggest_discounts(size=BLOCK_SIZE):
+    """Available discounted shoes, largest share of the original price off first."""
+    share = ExpressionWrapper(
+        F('discount') / (F('price') + F('discount')), output_field=DecimalField(max_digits=9, decimal_places=4)
+    )
+    return list(
+        _available_shoes().filter(discount__gt=0)
+        .annotate(share=share)
+        .order_by('-share', '-discount', 'shoe_id')
+        .values_list('shoe_id', flat=True)[:size]
+    )
+
+
+def compute_blocks(size=BLOCK_SIZE):
+    blocks = {'new_arrivals': new_arrivals(size)}
+    for block, days in BESTSELLER_WINDOWS.items():
+        blocks[block] = bestsellers(days, size)
+    blocks['on_sale'] = biggest_discounts(size)
+    return blocks
+
+
+def build_snapshots(size=BLOCK_SIZE, ttl=SNAPSHOT_TTL):
+    """Recompute every block and replace its snapshot. Returns ``{block: shoe ids}``."""
+    blocks = compute_blocks(size)
+    now = timezone.now()
+    with transaction.atomic():
+        MerchandisingSnapshot.objects.bulk_create(
+            [
+                MerchandisingSnapshot(block=block, shoe_ids=shoe_ids, computed_at=now, expires_at=now + ttl)
+                for block, shoe_ids in blocks.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['block'],
+            update_fields=['shoe_ids', 'computed_at', 'expires_at'],
+        )
+    return blocks
+
+
+def home_blocks():
+    """``[{'block', 'title', 'shoes'}]`` from the live snapshots, in BLOCK_TITLES order.
+
+    Two primary-key lookups: the snapshots, then all their shoes with listings.
+    """
+    snapshots = {
+        snapshot.block: snapshot.shoe_ids
+        for snapshot in MerchandisingSnapshot.objects.filter(block__in=BLOCK_TITLES, expires_at__gt=timezone.now())
+    }
+    ids = {shoe_id for shoe_ids in snapshots.values() for shoe_id in shoe_ids}
+    shoes = Shoe.objects.select_related('listing').in_bulk(ids) if ids else {}
+    blocks = []
+    for block, title in BLOCK_TITLES.items():
+        # shoes deleted since the snapshot was taken are skipped
+        listed = [shoes[shoe_id] for shoe_id in snapshots.get(block, []) if shoe_id in shoes]
+        if listed:
+            blocks.append({'block': block, 'title': title, 'shoes': listed})
+    return blocks
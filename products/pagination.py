@@ -0,0 +1,164 @@
+"""Keyset (cursor) pagination.
+
+Instead of OFFSET, each page continues from the sort key of the last row of
+the previous one, so every page costs the same indexed range scan and no
+COUNT(*) is needed. Cursors are signed, opaque tokens holding the sort key
+and the paging direction.
+"""
+import datetime
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+
+class CursorPaginator:
+    """Paginate ``queryset`` by ``ordering``, a sequence of field names.
+
+    Prefix a field with '-' for descending order. The last field must be
+    unique (normally the primary key) so the sort key identifies one row,
+    and none of the fields may be NULL.
+    """
+
+    salt = 'products.pagination.cursor'
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+        self.per_page = per_page
+        self.fields = [queryset.model._meta.get_field(name) for name, _ in self.ordering]
+
+    def _order_by(self, reverse=False):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.ordering
+        ]
+
+    def _key(self, obj):
+        return [getattr(obj, field.attname) for field in self.fields]
+
+    def encode_cursor(self, obj, direction):
+        payload = {'k': self._key(obj), 'd': direction}
+        return signing.dumps(payload, salt=self.salt, serializer=_CursorSerializer, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = signing.loads(cursor, salt=self.salt, serializer=_CursorSerializer)
+            values, direction = payload['k'], payload['d']
+            if direction not in ('next', 'prev') or len(values) != len(self.fields):
+                raise InvalidCursor('Malformed cursor.')
+            values = [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError) as e:
+            raise InvalidCursor('Invalid cursor.') from e
+        return values, direction
+
+    def _seek(self, values, reverse):
+        """Q for rows strictly after ``values`` in sort order (before them if ``reverse``)."""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def page(self, cursor=None):
+        if not cursor:
+            values, direction = None, 'next'
+        else:
+            values, direction = self.decode_cursor(cursor)
+
+        reverse = direction == 'prev'
+        qs = self.queryset.order_by(*self._order_by(reverse=reverse))
+        if values is not None:
+            qs = qs.filter(self._seek(values, reverse))
+
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = self.encode_cursor(rows[-1], 'next') if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], 'prev') if rows and has_previous else None
+        return CursorPage(rows, has_next, has_previous, next_cursor, previous_cursor)
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder drops microseconds past the millisecond, which would make the seek skip rows
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _CursorSerializer:
+    """JSON serializer that accepts Decimal/date values in the sort key."""
+
+    def dumps(self, obj):
+        return _CursorEncoder(separators=(',', ':')).encode(obj).encode('latin-1')
+
+    def loads(self, data):
+        return signing.JSONSerializer().loads(data)
+
+
+class ObjectIdList:
+    """Paginator-friendly sequence over an ordered list of primary keys.
+
+    Only the slice for the requested page is loaded, in one query, with the
+    list's order preserved.
+    """
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index]
+        objects = self.queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
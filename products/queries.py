@@ -0,0 +1,18 @@
+"""Reusable queryset helpers for catalog pages."""
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def top_n_per_group(queryset, group_field, ordering, n):
+    """The first ``n`` rows of each ``group_field`` value by ``ordering``, in one query.
+
+    ``ordering`` takes order_by() style names ('-price'). Rows come back
+    grouped, in ``ordering`` within each group, with their position as
+    ``group_rank``.
+    """
+    order_by = [F(name[1:]).desc() if name.startswith('-') else F(name).asc() for name in ordering]
+    return (
+        queryset.annotate(group_rank=Window(RowNumber(), partition_by=[F(group_field)], order_by=order_by))
+        .filter(group_rank__lte=n)
+        .order_by(group_field, 'group_rank')
+    )
@@ -0,0 +1,107 @@
+"""Maintenance of the ShoeRating statistics.
+
+Review writes adjust the counters of the reviewed shoe with a single
+F-expression UPDATE, so concurrent reviews never lose an increment. The
+average is then recomputed from the updated row in the same transaction,
+while the UPDATE still holds its row lock. reconcile() recomputes every row
+from the Review table in case the counters ever drift. Both bump the catalog
+version after commit, since cached rating filters and sorts depend on them.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from models_app.models import Review, ShoeRating, ShoeVariant
+from . import catalog_cache
+
+STARS = range(1, 6)
+AVERAGE_STEP = Decimal('0.01')
+
+
+def _average(count, total):
+    if not count:
+        return None
+    return (Decimal(total) / count).quantize(AVERAGE_STEP)
+
+
+def review_shoe_id(review):
+    """Id of the shoe a review is about."""
+    return (
+        ShoeVariant.objects.filter(order_items__pk=review.order_item_id)
+        .values_list('shoe_id', flat=True)
+        .first()
+    )
+
+
+def record(shoe_id, rating, delta):
+    """Add (``delta=1``) or remove (``delta=-1``) one rating of a shoe."""
+    if shoe_id is None or rating not in STARS:
+        return
+    stars = f'stars_{rating}'
+    with transaction.atomic():
+        rows = ShoeRating.objects.filter(pk=shoe_id)
+        if delta > 0:
+            ShoeRating.objects.bulk_create([ShoeRating(shoe_id=shoe_id)], ignore_conflicts=True)
+        else:
+            # never below zero; and when the shoe itself is being deleted its row is already gone
+            rows = rows.filter(count__gt=0, **{f'{stars}__gt': 0})
+        updated = rows.update(
+            count=F('count') + delta,
+            total=F('total') + delta * rating,
+            **{stars: F(stars) + delta},
+        )
+        if not updated:
+            return
+        count, total = ShoeRating.objects.filter(pk=shoe_id).values_list('count', 'total').get()
+        ShoeRating.objects.filter(pk=shoe_id).update(average=_average(count, total))
+        # rating filters, the rating sort and facet counts are cached under the catalog version
+        transaction.on_commit(catalog_cache.bump_catalog_version)
+
+
+def reconcile():
+    """Recompute every shoe's statistics from its reviews. Returns the ids of the shoes that changed."""
+    rows = (
+        Review.objects.values('order_item__variant__shoe_id')
+        .annotate(
+            count=Count('pk'),
+            total=Sum('rating'),
+            **{f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars in STARS},
+        )
+    )
+    fresh = {}
+    for row in rows:
+        shoe_id = row.pop('order_item__variant__shoe_id')
+        fresh[shoe_id] = ShoeRating(shoe_id=shoe_id, average=_average(row['count'], row['total']), **row)
+
+    fields = ['count', 'total', 'average'] + [f'stars_{stars}' for stars in STARS]
+    current = {rating.shoe_id: rating for rating in ShoeRating.objects.all()}
+    changed = {
+        shoe_id for shoe_id, rating in fresh.items()
+        if shoe_id not in current or any(getattr(rating, f) != getattr(current[shoe_id], f) for f in fields)
+    }
+    # shoes whose reviews are all gone keep a zeroed row
+    emptied = {
+        shoe_id for shoe_id, rating in current.items()
+        if shoe_id not in fresh and rating.count
+    }
+    zero = {field: 0 for field in fields if field != 'average'}
+    with transaction.atomic():
+        ShoeRating.objects.bulk_create(
+            [fresh[shoe_id] for shoe_id in changed]
+            + [ShoeRating(shoe_id=shoe_id, average=None, **zero) for shoe_id in emptied],
+            update_conflicts=True,
+            unique_fields=['shoe'],
+            update_fields=fields,
+        )
+        if changed or emptied:
+            transaction.on_commit(catalog_cache.bump_catalog_version)
+    return changed | emptied
+
+
+def rating_of(shoe):
+    """The shoe's statistics, or an unsaved empty row if it has never been reviewed."""
+    try:
+        return shoe.rating_stats
+    except ShoeRating.DoesNotExist:
+        return ShoeRating(shoe=shoe)
@@ -0,0 +1,180 @@
+"""Offline "frequently bought together" recommendations.
+
+Orders are treated as rows of a sparse order x shoe matrix, and the batch job
+accumulates that matrix's shoe x shoe co-occurrence counts in ShoePairCount,
+one row per non-zero entry. Each run counts only the orders that have no
+CountedOrder row yet, adds their pair counts, and rebuilds the top-N list of
+every shoe whose counts changed, so history is never rescanned.
+
+A still-pending order placed within the last PENDING_GRACE_DAYS is left for a
+later run, since items may still be added to it or it may be cancelled; it
+doesn't hold back the orders after it. Cancelled orders are skipped, and an
+order cancelled after it was counted has its pairs taken back out.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from models_app.models import (
+    CountedOrder, Order, OrderItem, RecommendationRun, ShoePairCount, ShoeRecommendation,
+)
+
+TOP_N = 6
+PENDING_GRACE_DAYS = 7
+ORDER_BATCH_SIZE = 500
+
+
+def countable_orders():
+    """Orders that can be counted now and haven't been."""
+    cutoff = timezone.localdate() - timedelta(days=PENDING_GRACE_DAYS)
+    return (
+        Order.objects.exclude(status__iexact='cancelled')
+        .exclude(status__iexact='pending', order_date__gte=cutoff)
+        .filter(~Exists(CountedOrder.objects.filter(order_id=OuterRef('pk'))))
+    )
+
+
+def count_pairs(order_ids):
+    """Co-occurrence counts of the given orders: ``({(shoe, other): n}, orders with items)``."""
+    order_ids = sorted(order_ids)
+    counts = Counter()
+    orders = 0
+    for start in range(0, len(order_ids), ORDER_BATCH_SIZE):
+        rows = (
+            OrderItem.objects.filter(order_id__in=order_ids[start:start + ORDER_BATCH_SIZE])
+            .order_by('order_id')
+            .values_list('order_id', 'variant__shoe_id')
+            .distinct()
+        )
+        for _, items in groupby(rows.iterator(), key=itemgetter(0)):
+            orders += 1
+            shoes = sorted({shoe_id for _, shoe_id in items})
+            for shoe_id, other_id in combinations(shoes, 2):
+                counts[(shoe_id, other_id)] += 1
+                counts[(other_id, shoe_id)] += 1
+    return counts, orders
+
+
+def _upsert_sql(rows=1):
+    table = connection.ops.quote_name(ShoePairCount._meta.db_table)
+    shoe, other, count = (
+        connection.ops.quote_name(ShoePairCount._meta.get_field(name).column) for name in ('shoe', 'other', 'count')
+    )
+    values = ', '.join(['(%s, %s, %s)'] * rows)
+    return (
+        f'INSERT INTO {table} ({shoe}, {other}, {count}) VALUES {values} '
+        f'ON CONFLICT ({shoe}, {other}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}'
+    )
+
+
+def _add_counts(counts, batch_size=500):
+    # the database adds each delta to the stored count, so concurrent runs can't overwrite each other
+    pairs = sorted(counts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            cursor.execute(
+                _upsert_sql(len(batch)), [value for (shoe_id, other_id), n in batch for value in (shoe_id, other_id, n)]
+            )
+    return {shoe_id for shoe_id, _ in counts}
+
+
+def _subtract_counts(counts):
+    # counted pairs always have a row; an update keeps the negative delta away from the insert's CHECK
+    by_delta = defaultdict(lambda: defaultdict(list))
+    for (shoe_id, other_id), n in counts.items():
+        by_delta[n][shoe_id].append(other_id)
+    for n, pairs in by_delta.items():
+        for shoe_id, other_ids in pairs.items():
+            ShoePairCount.objects.filter(shoe_id=shoe_id, other_id__in=other_ids, count__gte=n).update(
+                count=F('count') - n
+            )
+    return {shoe_id for shoe_id, _ in counts}
+
+
+def rebuild_top(shoe_ids, top_n=TOP_N, batch_size=200):
+    """Rewrite the recommendation lists of the given shoes from their pair counts."""
+    shoe_ids = sorted(shoe_ids)
+    for start in range(0, len(shoe_ids), batch_size):
+        batch = shoe_ids[start:start + batch_size]
+        # the database keeps only each shoe's top_n pairs
+        top = (
+            ShoePairCount.objects.filter(shoe_id__in=batch)
+            .annotate(rank=Window(
+                RowNumber(), partition_by=[F('shoe_id')], order_by=[F('count').desc(), F('other_id').asc()]
+            ))
+            .filter(rank__lte=top_n)
+            .values_list('shoe_id', 'other_id', 'count', 'rank')
+        )
+        rows = [
+            ShoeRecommendation(shoe_id=shoe_id, recommended_id=other_id, score=count, rank=rank)
+            for shoe_id, other_id, count, rank in top
+        ]
+        ShoeRecommendation.objects.filter(shoe_id__in=batch).delete()
+        ShoeRecommendation.objects.bulk_create(rows)
+
+
+def uncount_orders(order_ids, top_n=TOP_N):
+    """Take counted orders' pairs back out and refresh the affected lists. Returns the shoes touched."""
+    with transaction.atomic():
+        counted = list(
+            CountedOrder.objects.select_for_update().filter(order_id__in=order_ids).values_list('order_id', flat=True)
+        )
+        if not counted:
+            return set()
+        counts, _ = count_pairs(counted)
+        CountedOrder.objects.filter(order_id__in=counted).delete()
+        if not counts:
+            return set()
+        touched = _subtract_counts(counts)
+        ShoePairCount.objects.filter(shoe_id__in=touched, count=0).delete()
+        rebuild_top(touched, top_n)
+    return touched
+
+
+def order_status_changed(order_id, old_status, new_status):
+    """Called with lowercase statuses when an order changes status; applies after commit.
+
+    Orders moving out of cancelled need nothing here: they are uncounted, so
+    the next run counts them.
+    """
+    if new_status == 'cancelled':
+        transaction.on_commit(lambda: uncount_orders([order_id]))
+
+
+def update_recommendations(top_n=TOP_N, full=False):
+    """Count the orders not counted yet and refresh the affected lists.
+
+    ``full`` forgets every count and starts again from the first order.
+    Returns the RecommendationRun recorded.
+    """
+    with transaction.atomic():
+        if full:
+            ShoePairCount.objects.all().delete()
+            ShoeRecommendation.objects.all().delete()
+            CountedOrder.objects.all().delete()
+            RecommendationRun.objects.all().delete()
+        order_ids = list(countable_orders().order_by('pk').values_list('pk', flat=True))
+        counts, _ = count_pairs(order_ids)
+        CountedOrder.objects.bulk_create([CountedOrder(order_id=order_id) for order_id in order_ids], batch_size=500)
+        touched = _add_counts(counts) if counts else set()
+        rebuild_top(touched, top_n)
+        return RecommendationRun.objects.create(
+            last_order_id=max(order_ids, default=0), orders_processed=len(order_ids), shoes_updated=len(touched)
+        )
+
+
+def frequently_bought_with(shoe, limit=TOP_N):
+    """Shoes recommended alongside ``shoe``, best first; one indexed lookup joined to the listing rows."""
+    recommendations = (
+        ShoeRecommendation.objects.filter(shoe=shoe)
+        .select_related('recommended__listing')
+        .order_by('rank')[:limit]
+    )
+    return [recommendation.recommended for recommendation in recommendations]
@@ -0,0 +1,121 @@
+"""Short-lived stock reservations for customers in checkout.
+
+Opening checkout holds the cart's units of quantity-managed variants for
+RESERVATION_MINUTES, so when the last pairs are contended the losers learn it
+before filling in addresses and payment. Free stock is the variant's stock
+minus the active (unexpired) reservations of everyone else; it is read with
+one GROUP BY over the (variant, expires_at) index.
+
+Expired reservations stop counting the moment they expire. The
+release_expired_reservations command deletes them and refreshes the listing
+rows and cached availability of shoes whose expiry made a variant orderable again.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from models_app.models import ShoeVariant, StockReservation
+
+RESERVATION_MINUTES = 10
+
+
+def reserved_quantities(variant_ids, exclude_customer_id=None, now=None):
+    """``{variant_id: units}`` held by active reservations, optionally not counting one customer's."""
+    reservations = StockReservation.objects.filter(variant_id__in=variant_ids, expires_at__gt=now or timezone.now())
+    if exclude_customer_id is not None:
+        reservations = reservations.exclude(customer_id=exclude_customer_id)
+    return dict(
+        reservations.order_by().values('variant_id').annotate(units=Sum('quantity')).values_list('variant_id', 'units')
+    )
+
+
+def _availability_changed(shoe_ids):
+    # listing cards, cached product pages and the availability index show reserved-out variants as unavailable
+    from . import availability, listing, variants
+    listing.schedule_refresh(shoe_ids)
+    availability.schedule_refresh(shoe_ids)
+    variants.invalidate(shoe_ids)
+
+
+def _flipped(variant, units_before, units_after):
+    return (variant.stock - units_before > 0) != (variant.stock - units_after > 0)
+
+
+def reserve_cart(customer_id, lines, minutes=RESERVATION_MINUTES):
+    """Hold the units of a priced cart's lines; replaces the customer's earlier reservations.
+
+    Lines of quantity-managed variants that can't be covered by free stock
+    are not held. Returns ``{variant_id: free units}`` for those lines.
+    """
+    wanted = {}
+    for line in lines:
+        if line.variant.stock_management == 'quantity':
+            wanted[line.variant.variant_id] = wanted.get(line.variant.variant_id, 0) + line.quantity
+    now = timezone.now()
+    with transaction.atomic():
+        held = dict(
+            StockReservation.objects.filter(customer_id=customer_id, expires_at__gt=now)
+            .values_list('variant_id', 'quantity')
+        )
+        touched = set(wanted) | set(held)
+        if not touched:
+            return {}
+        # lock the variants so two checkouts can't both take the last units
+        variants = ShoeVariant.objects.select_for_update().only('stock', 'shoe_id').in_bulk(touched)
+        reserved = reserved_quantities(touched, now=now)
+
+        shortfalls = {}
+        for variant_id, quantity in list(wanted.items()):
+            free = variants[variant_id].stock - (reserved.get(variant_id, 0) - held.get(variant_id, 0))
+            if free < quantity:
+                shortfalls[variant_id] = max(free, 0)
+                del wanted[variant_id]
+
+        StockReservation.objects.filter(customer_id=customer_id).exclude(variant_id__in=wanted).delete()
+        expires_at = now + timedelta(minutes=minutes)
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(customer_id=customer_id, variant_id=variant_id, quantity=quantity, expires_at=expires_at)
+                for variant_id, quantity in wanted.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['customer', 'variant'],
+            update_fields=['quantity', 'expires_at'],
+        )
+
+        changed = set()
+        for variant_id in touched:
+            before = reserved.get(variant_id, 0)
+            after = before - held.get(variant_id, 0) + wanted.get(variant_id, 0)
+            if _flipped(variants[variant_id], before, after):
+                changed.add(variants[variant_id].shoe_id)
+        _availability_changed(changed)
+    return shortfalls
+
+
+def release(customer_id):
+    """Drop a customer's reservations, e.g. once their order holds the stock instead."""
+    StockReservation.objects.filter(customer_id=customer_id).delete()
+
+
+def sweep():
+    """Delete expired reservations. Returns the number deleted."""
+    now = timezone.now()
+    with transaction.atomic():
+        expired = dict(
+            StockReservation.objects.filter(expires_at__lte=now).order_by()
+            .values('variant_id').annotate(units=Sum('quantity')).values_list('variant_id', 'units')
+        )
+        if not expired:
+            return 0
+        deleted, _ = StockReservation.objects.filter(expires_at__lte=now).delete()
+        variants = ShoeVariant.objects.only('stock', 'shoe_id').in_bulk(expired)
+        active = reserved_quantities(expired, now=now)
+        # cached data computed while a reservation was active may show its variant as unavailable
+        _availability_changed({
+            variant.shoe_id for variant_id, variant in variants.items()
+            if _flipped(variant, active.get(variant_id, 0) + expired[variant_id], active.get(variant_id, 0))
+        })
+    return deleted
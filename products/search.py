@@ -0,0 +1,222 @@
+"""Full-text search over the shoe catalog.
+
+SQLite keeps the index in an FTS5 virtual table keyed by shoe_id (the rowid),
+PostgreSQL in a tsvector table with a GIN index. Both cover the shoe name,
+description and brand name. Any other backend (or an SQLite build without
+FTS5) reports itself as unsupported and callers fall back to icontains.
+
+Results are ranked by relevance with per-field weights. On SQLite that is
+BM25 over the term statistics FTS5 keeps in its shadow tables (document
+count, average field length, per-term document frequency), so nothing is
+recomputed per query. PostgreSQL has no BM25; ts_rank with the same field
+weights and document-length normalization is used instead.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from models_app.models import Shoe
+
+SQLITE_TABLE = 'products_shoe_fts'
+POSTGRES_TABLE = 'products_shoe_search'
+
+# relative weight of a match in each field
+FIELD_WEIGHTS = {'name': 10.0, 'description': 1.0, 'brand': 5.0}
+# bm25() takes weights in column order
+SQLITE_WEIGHTS = (FIELD_WEIGHTS['name'], FIELD_WEIGHTS['description'], FIELD_WEIGHTS['brand'])
+# ts_rank() takes weights for the {D, C, B, A} labels (name=A, brand=B, description=D), at most 1.0
+POSTGRES_WEIGHTS = '{%s, 0, %s, %s}' % tuple(
+    FIELD_WEIGHTS[field] / max(FIELD_WEIGHTS.values()) for field in ('description', 'brand', 'name')
+)
+# ts_rank normalization flag 1: divide by 1 + log(document length)
+POSTGRES_NORMALIZATION = 1
+
+# ranked searches return at most this many shoes
+TOP_K = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts5_available = None
+
+
+def _sqlite_has_fts5():
+    global _fts5_available
+    if _fts5_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            options = {row[0] for row in cursor.fetchall()}
+        _fts5_available = 'ENABLE_FTS5' in options
+    return _fts5_available
+
+
+def is_supported():
+    """Return True if the current database has a full-text backend."""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return _sqlite_has_fts5()
+    return False
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def ensure_index():
+    """Create the search table if it does not exist yet."""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+                f"USING fts5(name, description, brand, tokenize='unicode61 remove_diacritics 2')"
+            )
+        else:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} '
+                f'(shoe_id integer PRIMARY KEY, document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin '
+                f'ON {POSTGRES_TABLE} USING GIN (document)'
+            )
+
+
+def _documents(shoes):
+    for shoe in shoes:
+        brand = shoe.brand.name if shoe.brand else ''
+        yield (shoe.shoe_id, shoe.name, shoe.description, brand)
+
+
+def _write(documents):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'INSERT INTO {SQLITE_TABLE}(rowid, name, description, brand) VALUES (%s, %s, %s, %s)',
+                documents,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (shoe_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || "
+                f"setweight(to_tsvector('simple', %s), 'D') || "
+                f"setweight(to_tsvector('simple', %s), 'B')) "
+                f"ON CONFLICT (shoe_id) DO UPDATE SET document = EXCLUDED.document",
+                documents,
+            )
+
+
+def remove_shoes(shoe_ids):
+    """Drop the given shoes from the index."""
+    shoe_ids = list(shoe_ids)
+    if not shoe_ids or not is_supported():
+        return
+    placeholders = ', '.join(['%s'] * len(shoe_ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})', shoe_ids)
+        else:
+            cursor.execute(f'DELETE FROM {POSTGRES_TABLE} WHERE shoe_id IN ({placeholders})', shoe_ids)
+
+
+def index_shoes(shoe_ids):
+    """(Re)index the given shoes, dropping any that no longer exist."""
+    shoe_ids = list(shoe_ids)
+    if not shoe_ids or not is_supported():
+        return
+    shoes = Shoe.objects.filter(pk__in=shoe_ids).select_related('brand')
+    # FTS5 has no upsert, so always delete first
+    remove_shoes(shoe_ids)
+    _write(list(_documents(shoes)))
+
+
+def rebuild_index(batch_size=500):
+    """Rebuild the whole index from the Shoe table. Returns the number of shoes indexed."""
+    if not is_supported():
+        return 0
+    ensure_index()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+        else:
+            cursor.execute(f'TRUNCATE {POSTGRES_TABLE}')
+
+    count = 0
+    batch = []
+    for document in _documents(Shoe.objects.select_related('brand').order_by('pk').iterator(chunk_size=batch_size)):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            _write(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _write(batch)
+        count += len(batch)
+    return count
+
+
+def _sqlite_match(tokens):
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _postgres_tsquery(tokens):
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def match_filter(query):
+    """A Shoe filter for the matches of ``query``, unranked; None when unsupported.
+
+    The ids stay in the database as a subquery on the index, so a query
+    matching most of the catalog costs no more than one matching a few shoes.
+    """
+    if not is_supported():
+        return None
+    tokens = tokenize(query)
+    if not tokens:
+        return Q(pk__in=[])
+    if connection.vendor == 'sqlite':
+        subquery = RawSQL(f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s', [_sqlite_match(tokens)])
+    else:
+        subquery = RawSQL(
+            f"SELECT shoe_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('simple', %s)",
+            [_postgres_tsquery(tokens)],
+        )
+    return Q(pk__in=subquery)
+
+
+def search_shoe_ids(query, limit=None):
+    """Return shoe ids matching every word of ``query``, best match first.
+
+    Each word is matched as a prefix so partially typed words still hit.
+    ``limit`` keeps only the top-k; the database picks them without sorting
+    every match. Returns None when the database has no full-text backend.
+    """
+    if not is_supported():
+        return None
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    limit_sql = ' LIMIT %s' if limit else ''
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+            params = [_sqlite_match(tokens)] + ([limit] if limit else [])
+            cursor.execute(
+                f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s '
+                f'ORDER BY bm25({SQLITE_TABLE}, {weights}), rowid{limit_sql}',
+                params,
+            )
+        else:
+            params = [_postgres_tsquery(tokens)] + ([limit] if limit else [])
+            cursor.execute(
+                f"SELECT shoe_id FROM {POSTGRES_TABLE}, to_tsquery('simple', %s) query "
+                f"WHERE document @@ query "
+                f"ORDER BY ts_rank('{POSTGRES_WEIGHTS}', document, query, {POSTGRES_NORMALIZATION}) DESC, "
+                f"shoe_id{limit_sql}",
+                params,
+            )
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,175 @@
+from django.db import transaction
+from django.db.models.signals import post_migrate, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from models_app.models import Shoe, ShoeVariant, ShoeImage, Brand, Review
+from . import availability, catalog_cache, eligibility, fuzzy, listing, ratings, search, variants
+from .suggest import suggester
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    app_config = kwargs.get('app_config')
+    if app_config and app_config.name != 'products':
+        return
+    search.ensure_index()
+
+
+@receiver(pre_save, sender=Shoe)
+@receiver(pre_save, sender=Brand)
+def name_pre_save(sender, instance, update_fields=None, **kwargs):
+    # remember whether this save (re)names the row, for the indexes built from names only
+    if update_fields is not None and 'name' not in update_fields:
+        instance._name_changed = False
+    elif instance.pk is None:
+        instance._name_changed = True
+    else:
+        previous = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+        instance._name_changed = previous != instance.name
+
+
+def _renamed(instance):
+    return getattr(instance, '_name_changed', True)
+
+
+def _index_on_commit(shoe_ids):
+    # index what was committed: a rolled-back save leaves the full-text index alone
+    shoe_ids = list(shoe_ids)
+    if shoe_ids:
+        transaction.on_commit(lambda: search.index_shoes(shoe_ids))
+
+
+@receiver(post_save, sender=Shoe)
+def shoe_saved(sender, instance, **kwargs):
+    # fixtures may load shoes before their brand; run rebuild_search_index after loaddata
+    if kwargs.get('raw'):
+        return
+    _index_on_commit([instance.pk])
+    # trigrams only cover the name (see name_pre_save)
+    if _renamed(instance):
+        fuzzy.index_shoe(instance)
+
+
+@receiver(post_delete, sender=Shoe)
+def shoe_deleted(sender, instance, **kwargs):
+    shoe_ids = [instance.pk]
+    transaction.on_commit(lambda: search.remove_shoes(shoe_ids))
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    _index_on_commit(instance.shoes.values_list('pk', flat=True))
+    if _renamed(instance):
+        fuzzy.index_brand(instance)
+
+
+@receiver(pre_delete, sender=Brand)
+def brand_pre_delete(sender, instance, **kwargs):
+    # the shoes lose their brand via SET_NULL, so remember them before the delete
+    instance._indexed_shoe_ids = list(instance.shoes.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Brand)
+def brand_deleted(sender, instance, **kwargs):
+    _index_on_commit(getattr(instance, '_indexed_shoe_ids', []))
+
+
+@receiver(post_save, sender=Shoe)
+@receiver(post_delete, sender=Shoe)
+@receiver(post_save, sender=ShoeVariant)
+@receiver(post_delete, sender=ShoeVariant)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def catalog_changed(sender, **kwargs):
+    # invalidates every cached facet/listing entry keyed on the catalog version; after commit, so
+    # a request reading the old rows meanwhile can't cache them under the new version
+    transaction.on_commit(catalog_cache.bump_catalog_version)
+
+
+def _names_changed():
+    catalog_cache.bump_names_version()
+    # other processes notice the new version within suggest.CHECK_INTERVAL
+    suggester.invalidate()
+
+
+@receiver(post_save, sender=Shoe)
+@receiver(post_save, sender=Brand)
+def name_saved(sender, instance, **kwargs):
+    # after commit, so the suggester never rebuilds from names that may still roll back
+    if _renamed(instance):
+        transaction.on_commit(_names_changed)
+
+
+@receiver(post_delete, sender=Shoe)
+@receiver(post_delete, sender=Brand)
+def name_deleted(sender, instance, **kwargs):
+    transaction.on_commit(_names_changed)
+
+
+@receiver(post_save, sender=Shoe)
+def shoe_listing_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    listing.schedule_refresh([instance.pk])
+    # canonical sizes of US variants depend on the shoe's gender
+    availability.schedule_refresh([instance.pk])
+
+
+@receiver(post_save, sender=ShoeVariant)
+@receiver(post_delete, sender=ShoeVariant)
+@receiver(post_save, sender=ShoeImage)
+@receiver(post_delete, sender=ShoeImage)
+def shoe_part_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    listing.schedule_refresh([instance.shoe_id])
+
+
+@receiver(post_save, sender=ShoeVariant)
+@receiver(post_delete, sender=ShoeVariant)
+def variant_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    availability.schedule_refresh([instance.shoe_id])
+    variants.invalidate([instance.shoe_id])
+
+
+@receiver(pre_save, sender=Review)
+def review_pre_save(sender, instance, **kwargs):
+    # remember what an edit replaces so the old rating can be taken back out
+    if kwargs.get('raw') or instance.pk is None:
+        return
+    instance._previous_rating = (
+        Review.objects.filter(pk=instance.pk)
+        .values_list('order_item__variant__shoe_id', 'rating')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if created:
+        eligibility.review_written(instance.order_item_id)
+    previous = None if created else getattr(instance, '_previous_rating', None)
+    current = (ratings.review_shoe_id(instance), instance.rating)
+    if previous == current:
+        return
+    if previous:
+        ratings.record(*previous, -1)
+    ratings.record(*current, 1)
+    # listing cards show the rating summary
+    changed = [current, previous] if previous else [current]
+    listing.schedule_refresh(shoe_id for shoe_id, _ in changed if shoe_id is not None)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    eligibility.review_removed(instance.order_item_id)
+    shoe_id = ratings.review_shoe_id(instance)
+    ratings.record(shoe_id, instance.rating, -1)
+    if shoe_id is not None:
+        listing.schedule_refresh([shoe_id])
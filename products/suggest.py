@@ -0,0 +1,106 @@
+"""Search-as-you-type suggestions from an in-process prefix index.
+
+Shoe names, brand names and category labels are held in sorted lists of
+lowercase keys. Every word start of a label gets its own key, so "zoom"
+finds "Air Zoom Pegasus". A lookup is one bisect plus a short scan, with no
+database access; the index is rebuilt when the names version changes (a
+shoe or brand was added, renamed or removed), which is checked at most every
+CHECK_INTERVAL seconds.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from models_app.models import Brand, Shoe
+from . import catalog_cache
+
+CHECK_INTERVAL = 5
+KINDS = ('shoes', 'brands', 'categories')
+
+
+class PrefixIndex:
+    """Sorted (key, label, url) entries for one kind of suggestion."""
+
+    def __init__(self, items):
+        entries = []
+        for label, url in items:
+            lowered = label.lower()
+            words_start = [0] + [i + 1 for i, char in enumerate(lowered) if char == ' ']
+            for start in words_start:
+                if start < len(lowered):
+                    entries.append((lowered[start:], label, url))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.entries = entries
+
+    def lookup(self, prefix, limit):
+        results = []
+        seen = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            _, label, url = self.entries[position]
+            if url not in seen:
+                seen.add(url)
+                results.append({'label': label, 'url': url})
+                if len(results) >= limit:
+                    break
+            position += 1
+        return results
+
+
+def _build():
+    search_url = reverse('products:search')
+    shoes = [
+        (name, reverse('products:shoe_details', args=[shoe_id]))
+        for shoe_id, name in Shoe.objects.values_list('shoe_id', 'name')
+    ]
+    brands = [
+        (name, reverse('products:by_brand', args=[brand_id]))
+        for brand_id, name in Brand.objects.values_list('brand_id', 'name')
+    ]
+    categories = [
+        (label, f"{search_url}?{urlencode({'category': code})}")
+        for code, label in Shoe.CATEGORY_CHOICES.items()
+    ]
+    return {
+        'shoes': PrefixIndex(shoes),
+        'brands': PrefixIndex(brands),
+        'categories': PrefixIndex(categories),
+    }
+
+
+class _Suggester:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _current(self):
+        now = time.monotonic()
+        if self._indexes is not None and now - self._checked_at < CHECK_INTERVAL:
+            return self._indexes
+        with self._lock:
+            version = catalog_cache.names_version()
+            if self._indexes is None or version != self._version:
+                # swap in a fresh index; readers holding the old one keep using it
+                self._indexes = _build()
+                self._version = version
+            self._checked_at = now
+            return self._indexes
+
+    def suggest(self, query, limit=5):
+        prefix = ' '.join(query.lower().split())
+        if not prefix:
+            return {kind: [] for kind in KINDS}
+        indexes = self._current()
+        return {kind: indexes[kind].lookup(prefix, limit) for kind in KINDS}
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+
+suggester = _Suggester()
@@ -1,3 +1,616 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from models_app.models import (
+    Brand, CountedOrder, Order, OrderItem, Review, SearchTrigram, Shoe, ShoeListing, ShoePairCount, ShoeRating,
+    ShoeVariant, StockReservation,
+)
+from . import (
+    availability, catalog_cache, eligibility, facets, filters, fuzzy, listing, pagination, ratings, recommendations, reservations,
+    search,
+)
+from .suggest import suggester
+
+
+def make_shoe(name='Air Zoom', price='1000', **fields):
+    fields = {'description': f'{name} for running and walking', 'category': 'running', 'gender': 'U', **fields}
+    return Shoe.objects.create(name=name, price=Decimal(price), **fields)
+
+
+def make_variant(shoe, color='Black', size=42, stock=5, **fields):
+    fields = {'size_system': 'EU', 'stock_management': 'quantity', 'in_stock': True, **fields}
+    return ShoeVariant.objects.create(shoe=shoe, color=color, size=size, stock=stock, **fields)
+
+
+def make_customer(username):
+    # a customer profile is created along with the user
+    return User.objects.create_user(username, f'{username}@example.com', 'pw12345!x').customer_profile
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # pairs of equal prices, so the shoe_id tie-breaker decides the order
+        cls.shoes = [make_shoe(f'Shoe {i}', price=str(1000 + i // 2 * 100)) for i in range(7)]
+
+    def setUp(self):
+        cache.clear()
+        self.paginator = pagination.CursorPaginator(Shoe.objects.all(), ('price', 'shoe_id'), 3)
+
+    def test_pages_cover_every_row_once(self):
+        seen = []
+        page = self.paginator.page()
+        seen += [shoe.pk for shoe in page]
+        while page.has_next():
+            page = self.paginator.page(page.next_cursor)
+            seen += [shoe.pk for shoe in page]
+        self.assertEqual(seen, [shoe.pk for shoe in self.shoes])
+
+    def test_previous_cursor_returns_to_the_earlier_page(self):
+        first = self.paginator.page()
+        second = self.paginator.page(first.next_cursor)
+        back = self.paginator.page(second.previous_cursor)
+        self.assertEqual([shoe.pk for shoe in back], [shoe.pk for shoe in first])
+        self.assertFalse(back.has_previous())
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = self.paginator.page().next_cursor
+        for bad in ('garbage', cursor[:-2] + 'xx'):
+            with self.assertRaises(pagination.InvalidCursor):
+                self.paginator.page(bad)
+
+    def test_listing_pages_by_cursor(self):
+        response = self.client.get(reverse('products:search'), {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([shoe.pk for shoe in response.context['shoes']], [shoe.pk for shoe in self.shoes[:6]])
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        response = self.client.get(reverse('products:search'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('products:reviews', args=[self.shoes[0].pk]), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoe = make_shoe()
+        cls.variant = make_variant(cls.shoe, stock=1)
+        cls.alice = make_customer('alice')
+        cls.bob = make_customer('bob')
+
+    def reserve(self, customer, quantity=1):
+        line = SimpleNamespace(variant=self.variant, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            return reservations.reserve_cart(customer.pk, [line])
+
+    def test_held_units_are_not_free_for_others(self):
+        self.assertEqual(self.reserve(self.alice), {})
+        self.assertEqual(self.reserve(self.bob), {self.variant.pk: 0})
+        self.assertEqual(reservations.reserved_quantities([self.variant.pk]), {self.variant.pk: 1})
+        self.assertEqual(reservations.reserved_quantities([self.variant.pk], exclude_customer_id=self.alice.pk), {})
+
+    def test_hold_marks_the_listing_unavailable_until_it_expires(self):
+        self.reserve(self.alice)
+        self.assertFalse(ShoeListing.objects.get(shoe=self.shoe).is_available)
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reservations.reserved_quantities([self.variant.pk]), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reservations.sweep(), 1)
+        self.assertTrue(ShoeListing.objects.get(shoe=self.shoe).is_available)
+
+    def test_order_cannot_take_units_held_by_someone_else(self):
+        self.reserve(self.alice)
+        order = Order.objects.create(customer=self.bob, status='Pending')
+        with self.assertRaises(ValidationError):
+            OrderItem.objects.create(order=order, variant=self.variant, quantity=1, price=self.shoe.price)
+
+        # the holder's own order goes through
+        order = Order.objects.create(customer=self.alice, status='Pending')
+        OrderItem.objects.create(order=order, variant=self.variant, quantity=1, price=self.shoe.price)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 0)
+
+
+class RatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoe = make_shoe()
+        cls.other_shoe = make_shoe('Ultraboost')
+        order = Order.objects.create(customer=make_customer('alice'), status='Pending')
+        cls.items = [
+            OrderItem.objects.create(order=order, variant=make_variant(shoe, color=color), quantity=1, price=shoe.price)
+            for shoe, color in ((cls.shoe, 'Black'), (cls.shoe, 'White'), (cls.other_shoe, 'Black'))
+        ]
+
+    def review(self, item, rating):
+        return Review.objects.create(order_item=item, rating=rating, title='Good', comment='Fits well')
+
+    def stats(self, shoe):
+        return ShoeRating.objects.values(
+            'count', 'total', 'average', 'stars_2', 'stars_3', 'stars_5'
+        ).get(shoe=shoe)
+
+    def test_counters_match_reconcile_after_add_edit_and_delete(self):
+        first = self.review(self.items[0], 5)
+        second = self.review(self.items[1], 2)
+        third = self.review(self.items[2], 4)
+        self.assertEqual(
+            self.stats(self.shoe),
+            {'count': 2, 'total': 7, 'average': Decimal('3.50'), 'stars_2': 1, 'stars_3': 0, 'stars_5': 1},
+        )
+        self.assertEqual(ratings.reconcile(), set())
+
+        first.rating = 3
+        first.save()
+        self.assertEqual(
+            self.stats(self.shoe),
+            {'count': 2, 'total': 5, 'average': Decimal('2.50'), 'stars_2': 1, 'stars_3': 1, 'stars_5': 0},
+        )
+        self.assertEqual(ratings.reconcile(), set())
+
+        second.delete()
+        third.delete()
+        self.assertEqual(self.stats(self.shoe)['count'], 1)
+        self.assertEqual(self.stats(self.other_shoe)['count'], 0)
+        self.assertIsNone(self.stats(self.other_shoe)['average'])
+        self.assertEqual(ratings.reconcile(), set())
+
+    def test_reconcile_repairs_drifted_counters(self):
+        self.review(self.items[0], 4)
+        ShoeRating.objects.filter(shoe=self.shoe).update(count=7, total=1)
+        self.assertEqual(ratings.reconcile(), {self.shoe.pk})
+        self.assertEqual(self.stats(self.shoe)['count'], 1)
+        self.assertEqual(self.stats(self.shoe)['total'], 4)
+
+
+    def test_reviewed_shoe_can_be_deleted(self):
+        self.review(self.items[0], 5)
+        self.review(self.items[1], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoe.delete()
+        self.assertFalse(Shoe.objects.filter(pk=self.shoe.pk).exists())
+        self.assertFalse(ShoeRating.objects.filter(shoe_id=self.shoe.pk).exists())
+        self.assertEqual(ratings.reconcile(), set())
+
+    def test_review_writes_expire_cached_listings_after_commit(self):
+        version = catalog_cache.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            review = self.review(self.items[0], 5)
+            self.assertEqual(catalog_cache.catalog_version(), version)
+        self.assertNotEqual(catalog_cache.catalog_version(), version)
+
+        version = catalog_cache.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertNotEqual(catalog_cache.catalog_version(), version)
+
+
+class VariantAvailabilityEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoe = make_shoe()
+        cls.variant = make_variant(cls.shoe, stock=1)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products:variant_availability')
+
+    def test_unchanged_stock_answers_304(self):
+        response = self.client.get(self.url, {'ids': self.shoe.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(str(self.shoe.pk), response.json()['shoes'])
+        etag = response['ETag']
+
+        response = self.client.get(self.url, {'ids': self.shoe.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.stock = 0
+            self.variant.save()
+        response = self.client.get(self.url, {'ids': self.shoe.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_malformed_ids_are_a_bad_request(self):
+        too_many = ','.join(str(shoe_id) for shoe_id in range(1, 52))
+        for ids in ('', 'abc', f'{self.shoe.pk},x', '-1', too_many):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.client.get(self.url, {'ids': ids}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class ReviewEligibilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoe = make_shoe()
+        cls.customer = make_customer('alice')
+        cls.order = Order.objects.create(customer=cls.customer, status='Pending')
+        cls.item = OrderItem.objects.create(order=cls.order, variant=make_variant(cls.shoe), quantity=1, price=cls.shoe.price)
+
+    def set_status(self, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = status
+            self.order.save()
+
+    def test_delivered_items_are_reviewable_once(self):
+        self.assertFalse(eligibility.can_review(self.customer, self.shoe))
+        self.set_status('Delivered')
+        self.assertEqual(eligibility.reviewable_item(self.customer, self.shoe), self.item)
+
+        review = Review.objects.create(order_item=self.item, rating=5, title='Great', comment='Comfortable')
+        self.assertFalse(eligibility.can_review(self.customer, self.shoe))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertTrue(eligibility.can_review(self.customer, self.shoe))
+
+    def test_leaving_delivered_revokes_and_rebuild_agrees(self):
+        self.set_status('Delivered')
+        self.assertEqual(eligibility.rebuild(), 1)
+        self.set_status('Shipped')
+        self.assertFalse(eligibility.can_review(self.customer, self.shoe))
+        self.assertEqual(eligibility.rebuild(), 0)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer('alice')
+        cls.shoes = [make_shoe(f'Shoe {i}') for i in range(3)]
+        cls.variants = [make_variant(shoe, stock=10) for shoe in cls.shoes]
+
+    def order(self, *indexes, status='Delivered'):
+        order = Order.objects.create(customer=self.customer, status='Pending')
+        for index in indexes:
+            OrderItem.objects.create(order=order, variant=self.variants[index], quantity=1, price=Decimal('1000'))
+        if status != 'Pending':
+            order.status = status
+            order.save()
+        return order
+
+    def pair_count(self, first, second):
+        shoe, other = self.shoes[first], self.shoes[second]
+        return ShoePairCount.objects.filter(shoe=shoe, other=other).values_list('count', flat=True).first()
+
+    def test_open_pending_order_does_not_hold_back_later_orders(self):
+        pending = self.order(0, 2, status='Pending')
+        later = self.order(0, 1)
+        run = recommendations.update_recommendations()
+        self.assertEqual(run.orders_processed, 1)
+        self.assertEqual(self.pair_count(0, 1), 1)
+        self.assertIsNone(self.pair_count(0, 2))
+        self.assertTrue(CountedOrder.objects.filter(order=later).exists())
+        self.assertFalse(CountedOrder.objects.filter(order=pending).exists())
+
+        # counted orders are not counted again
+        self.assertEqual(recommendations.update_recommendations().orders_processed, 0)
+        self.assertEqual(recommendations.frequently_bought_with(self.shoes[0]), [self.shoes[1]])
+
+    def test_cancelling_a_counted_order_takes_its_pairs_back(self):
+        self.order(0, 1)
+        cancelled = self.order(0, 1, 2)
+        recommendations.update_recommendations()
+        self.assertEqual(self.pair_count(0, 1), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelled.status = 'Cancelled'
+            cancelled.save()
+        self.assertEqual(self.pair_count(0, 1), 1)
+        self.assertIsNone(self.pair_count(0, 2))
+        self.assertEqual(recommendations.frequently_bought_with(self.shoes[2]), [])
+
+        # a full recount agrees
+        recommendations.update_recommendations(full=True)
+        self.assertEqual(self.pair_count(0, 1), 1)
+        self.assertIsNone(self.pair_count(1, 2))
+
+    def test_counts_are_added_to_the_stored_value(self):
+        self.order(0, 1)
+        # as if another run committed between this run's read and its write
+        ShoePairCount.objects.create(shoe=self.shoes[0], other=self.shoes[1], count=5)
+        recommendations.update_recommendations()
+        self.assertEqual((self.pair_count(0, 1), self.pair_count(1, 0)), (6, 1))
+
+
+class OrderStatusHookTests(TransactionTestCase):
+    def test_hooks_run_after_the_status_is_written(self):
+        shoes = [make_shoe(f'Shoe {i}') for i in range(2)]
+        order = Order.objects.create(customer=make_customer('alice'), status='Pending')
+        for shoe in shoes:
+            OrderItem.objects.create(order=order, variant=make_variant(shoe, stock=10), quantity=1, price=shoe.price)
+        order.status = 'Delivered'
+        order.save()
+        recommendations.update_recommendations()
+
+        # no surrounding transaction, so on_commit callbacks run at once
+        with CaptureQueriesContext(connection) as queries:
+            order.status = 'Cancelled'
+            order.save()
+        statements = [query['sql'] for query in queries]
+        written = next(i for i, sql in enumerate(statements) if sql.startswith(f'UPDATE "{Order._meta.db_table}"'))
+        uncounted = next(i for i, sql in enumerate(statements) if CountedOrder._meta.db_table in sql and 'DELETE' in sql)
+        self.assertLess(written, uncounted)
+        self.assertFalse(ShoePairCount.objects.filter(count__gt=0).exists())
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_entries_live_until_the_catalog_version_changes(self):
+        params = {'q': 'zoom'}
+        self.assertEqual(catalog_cache.get_or_compute('listing_ids', params, self.compute, 60), 1)
+        self.assertEqual(catalog_cache.get_or_compute('listing_ids', params, self.compute, 60), 1)
+        self.assertEqual(catalog_cache.get_or_compute('listing_ids', {'q': 'boost'}, self.compute, 60), 2)
+
+        # the version moves on commit, not while the new rows are still invisible to other requests
+        with self.captureOnCommitCallbacks(execute=True):
+            make_shoe()
+            self.assertEqual(catalog_cache.get_or_compute('listing_ids', params, self.compute, 60), 1)
+        self.assertEqual(catalog_cache.get_or_compute('listing_ids', params, self.compute, 60), 3)
+        self.assertEqual(catalog_cache.stats(['listing_ids'])['listing_ids'], {'hits': 2, 'misses': 3})
+
+    def test_shoe_versions_are_independent(self):
+        first, second = make_shoe(), make_shoe('Ultraboost')
+        versions = catalog_cache.shoe_versions([first.pk, second.pk])
+        catalog_cache.bump_shoe_versions([first.pk])
+        after = catalog_cache.shoe_versions([first.pk, second.pk])
+        self.assertNotEqual(after[first.pk], versions[first.pk])
+        self.assertEqual(after[second.pk], versions[second.pk])
+
+
+class SizeColourFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer('alice')
+        cls.shoe = make_shoe()
+        cls.variant = make_variant(cls.shoe, color='Black', size=42, stock=1)
+        # US 9 men's is EU 42 on the canonical scale
+        cls.us_shoe = make_shoe('Ultraboost', gender='M')
+        make_variant(cls.us_shoe, color='White', size=9, size_system='US')
+        availability.rebuild_availability()
+
+    def setUp(self):
+        cache.clear()
+
+    def matching(self, **params):
+        response = self.client.get(reverse('products:search'), params)
+        return {shoe.pk for shoe in response.context['shoes']}
+
+    def test_filters_use_canonical_sizes_and_colours(self):
+        self.assertEqual(self.matching(size='42'), {self.shoe.pk, self.us_shoe.pk})
+        self.assertEqual(self.matching(size='42', color=' black '), {self.shoe.pk})
+        self.assertEqual(self.matching(size='44'), set())
+
+    def test_selling_out_expires_only_stock_dependent_entries(self):
+        self.assertEqual(self.matching(size='42', color='Black'), {self.shoe.pk})
+        catalog_version = catalog_cache.catalog_version()
+        availability_version = catalog_cache.availability_version()
+
+        order = Order.objects.create(customer=self.customer, status='Pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=order, variant=self.variant, quantity=1, price=self.shoe.price)
+
+        self.assertEqual(catalog_cache.catalog_version(), catalog_version)
+        self.assertNotEqual(catalog_cache.availability_version(), availability_version)
+        self.assertEqual(self.matching(size='42', color='Black'), set())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        if not search.is_supported():
+            self.skipTest('no full-text backend')
+
+    def create(self, name, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_shoe(name, **fields)
+
+    def test_index_follows_committed_saves_and_deletes(self):
+        shoe = self.create('Pegasus Trail', description='Cushioned running shoe')
+        self.assertEqual(search.search_shoe_ids('pegasus'), [shoe.pk])
+        # words match as prefixes while typing
+        self.assertEqual(search.search_shoe_ids('pega tra'), [shoe.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.name = 'Vomero'
+            shoe.save()
+        self.assertEqual(search.search_shoe_ids('pegasus'), [])
+        self.assertEqual(search.search_shoe_ids('vomero'), [shoe.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.delete()
+        self.assertEqual(search.search_shoe_ids('vomero'), [])
+
+    def test_uncommitted_saves_are_not_indexed(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            make_shoe('Pegasus Trail')
+        self.assertEqual(search.search_shoe_ids('pegasus'), [])
+
+    def test_brand_rename_reindexes_its_shoes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            brand = Brand.objects.create(name='Nike', description='Sportswear')
+        shoe = self.create('Pegasus', brand=brand)
+        self.assertEqual(search.search_shoe_ids('nike'), [shoe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.name = 'Swoosh'
+            brand.save()
+        self.assertEqual(search.search_shoe_ids('nike'), [])
+        self.assertEqual(search.search_shoe_ids('swoosh'), [shoe.pk])
+
+    def test_name_matches_rank_above_description_matches(self):
+        in_description = self.create('Vomero', description='A trail shoe for long runs')
+        in_name = self.create('Trail Blazer', description='Built for long runs')
+        self.assertEqual(search.search_shoe_ids('trail'), [in_name.pk, in_description.pk])
+
+    def test_listing_filter_matches_in_the_database(self):
+        trails = [self.create(f'Trail {i}') for i in range(fuzzy.MIN_EXACT_HITS)]
+        vomero = self.create('Vomero')
+        listing = filters.filter_shoes(Shoe.objects.all(), {'q': 'trail'})
+        # the matches are a subquery on the index, not a list of ids
+        table = search.SQLITE_TABLE if connection.vendor == 'sqlite' else search.POSTGRES_TABLE
+        self.assertIn(table, str(listing.query))
+        self.assertEqual(set(listing.values_list('pk', flat=True)), {shoe.pk for shoe in trails})
+
+        # too few exact hits: padded with fuzzy matches
+        listing = filters.filter_shoes(Shoe.objects.all(), {'q': 'vomera'})
+        self.assertEqual(list(listing.values_list('pk', flat=True)), [vomero.pk])
+
+
+class FuzzySearchTests(TestCase):
+    def test_misspelled_names_still_match(self):
+        shoe = make_shoe('Pegasus Trail')
+        brand = Brand.objects.create(name='Adidas', description='Sportswear')
+        branded = make_shoe('Ultraboost', brand=brand)
+        self.assertEqual(fuzzy.similar_shoe_ids('pegasis'), [shoe.pk])
+        self.assertEqual(fuzzy.similar_shoe_ids('addidas'), [branded.pk])
+        self.assertEqual(fuzzy.similar_shoe_ids('xyzzy'), [])
+
+    def test_keyword_search_falls_back_to_fuzzy_matches(self):
+        shoe = make_shoe('Pegasus Trail')
+        self.assertEqual(filters.keyword_shoe_ids('pegasis'), [shoe.pk])
+
+    def test_only_renames_rewrite_trigrams(self):
+        shoe = make_shoe('Pegasus Trail')
+        table = SearchTrigram._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            shoe.price += 100
+            shoe.save()
+        self.assertFalse([query for query in queries if table in query['sql']])
+
+        shoe.name = 'Vomero'
+        shoe.save()
+        self.assertEqual(set(SearchTrigram.objects.filter(shoe=shoe).values_list('word', flat=True)), {'vomero'})
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        suggester.invalidate()
+        self.url = reverse('products:search_suggest')
+
+    def labels(self, q, kind='shoes'):
+        return [suggestion['label'] for suggestion in self.client.get(self.url, {'q': q}).json()[kind]]
+
+    def test_every_word_start_matches(self):
+        shoe = make_shoe('Pegasus Trail')
+        Brand.objects.create(name='Adidas', description='Sportswear')
+        self.assertEqual(self.labels('peg'), ['Pegasus Trail'])
+        self.assertEqual(self.labels('  TRA '), ['Pegasus Trail'])
+        self.assertEqual(self.labels('adi', 'brands'), ['Adidas'])
+        self.assertEqual(self.labels('run', 'categories'), ['Running'])
+        self.assertEqual(
+            self.client.get(self.url, {'q': 'peg'}).json()['shoes'][0]['url'],
+            reverse('products:shoe_details', args=[shoe.pk]),
+        )
+
+    def test_index_is_rebuilt_only_for_committed_name_changes(self):
+        shoe = make_shoe('Pegasus Trail')
+        self.assertEqual(self.labels('peg'), ['Pegasus Trail'])
+        version = catalog_cache.names_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.price += 100
+            shoe.save()
+            shoe.save(update_fields=['price'])
+        self.assertEqual(catalog_cache.names_version(), version)
+
+        # nothing moves before the rename commits
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.name = 'Vomero'
+            shoe.save()
+            self.assertEqual(catalog_cache.names_version(), version)
+        self.assertEqual(self.labels('peg'), [])
+        self.assertEqual(self.labels('vom'), ['Vomero'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.delete()
+        self.assertEqual(self.labels('vom'), [])
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nike = Brand.objects.create(name='Nike', description='Sportswear')
+        cls.adidas = Brand.objects.create(name='Adidas', description='Sportswear')
+        for name, price, category, brand, gender in (
+            ('Pegasus', '1500', 'running', cls.nike, 'M'),
+            ('Vomero', '6000', 'running', cls.nike, 'W'),
+            ('Samba', '3000', 'casual', cls.adidas, 'U'),
+            ('Gazelle', '12000', 'casual', cls.adidas, 'U'),
+        ):
+            make_shoe(name, price=price, category=category, brand=brand, gender=gender)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_ignore_their_own_selection(self):
+        counts = facets.facet_counts({'category': 'running'})
+        # the category dropdown still shows the alternatives
+        self.assertEqual(counts['category'], {'running': 2, 'casual': 2})
+        self.assertEqual(counts['brand'], {self.nike.pk: 2})
+        self.assertEqual(counts['gender'], {'M': 1, 'W': 1})
+        self.assertEqual(counts['price'], [1, 0, 1, 0])
+
+    def test_counts_combine_with_other_filters(self):
+        counts = facets.facet_counts({'brand': self.adidas.pk, 'max_price': Decimal('5000')})
+        self.assertEqual(counts['brand'], {self.adidas.pk: 1, self.nike.pk: 1})
+        self.assertEqual(counts['category'], {'casual': 1})
+        self.assertEqual(counts['price'], [0, 1, 0, 0])
+
+    def test_counts_are_cached_per_filter_set(self):
+        facets.facet_counts({'gender': 'U'})
+        with self.assertNumQueries(0):
+            facets.facet_counts({'gender': 'U'})
+
+
+class ListingTests(TestCase):
+    def test_rows_follow_shoe_variant_and_review_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe = make_shoe(price='2000')
+        card = ShoeListing.objects.get(shoe=shoe)
+        self.assertEqual((card.price, card.is_available, card.sizes), (Decimal('2000.00'), False, []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            variant = make_variant(shoe, color='Black', size=42, stock=2)
+            make_variant(shoe, color='White', size=43, stock=0)
+        card.refresh_from_db()
+        self.assertEqual((card.is_available, card.total_stock), (True, 2))
+        self.assertEqual((card.sizes, card.colors), (['EU 42'], ['Black']))
+
+        order = Order.objects.create(customer=make_customer('alice'), status='Pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            item = OrderItem.objects.create(order=order, variant=variant, quantity=2, price=shoe.price)
+        card.refresh_from_db()
+        self.assertEqual((card.is_available, card.total_stock), (False, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(order_item=item, rating=4, title='Good', comment='Fits well')
+        card.refresh_from_db()
+        self.assertEqual((card.rating_count, card.rating_average), (1, Decimal('4.00')))
+
+    def test_rebuild_matches_incremental_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe = make_shoe()
+            make_variant(shoe)
+        before = ShoeListing.objects.values().get(shoe=shoe)
+        ShoeListing.objects.all().delete()
+        self.assertEqual(listing.rebuild_listings(), 1)
+        after = ShoeListing.objects.values().get(shoe=shoe)
+        self.assertEqual({**before, 'updated_at': None}, {**after, 'updated_at': None})
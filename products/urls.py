@@ -7,9 +7,11 @@ app_name = 'products'
 
 urlpatterns = [
     path('search/', views.ShoeListView.as_view(), name='search'),
+    path('search/suggest/', views.search_suggestions, name='search_suggest'),
     path('gender/<str:gender>/', views.ShoeByGenderListView.as_view(), name='by_gender'),
     path('brand/<int:brand_id>/', views.ShoeByBrandListView.as_view(), name='by_brand'),
     path('<int:pk>/', views.ShoeDetailView.as_view(), name='shoe_details'),
+    path('availability/', views.variant_availability, name='variant_availability'),
     path('wishlist/', views.WishlistView.as_view(), name='wishlist'),
     path('wishlist/delete/<int:item_id>/', views.delete_wishlist_item, name='wishlist_delete'),
     path('wishlist/add/<int:shoe_id>/', views.add_wishlist_item, name='wishlist_add'),
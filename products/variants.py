@@ -0,0 +1,79 @@
+"""Colour × size variant matrix for the product page.
+
+Built in one pass over a shoe's variants and cached under the shoe's own
+version, which is bumped after commit whenever one of its variants is saved
+or deleted, its stock changes or a checkout reservation makes it
+(un)available. A cached product page therefore needs no variant queries at
+all, however many colours the shoe comes in.
+"""
+from django.db import transaction
+
+from models_app.models import Shoe
+from . import availability, catalog_cache, reservations
+
+MATRIX_TIMEOUT = 60 * 60
+
+
+def build_matrix(shoe, reserved=None):
+    """Matrix from the shoe's (ideally prefetched) variants.
+
+    ``colors`` keeps the order colours were first added in; each row lists
+    that colour's variants from the smallest canonical size up. ``reserved``
+    maps variant ids to units held in checkouts; it is looked up if omitted.
+    """
+    variants = sorted(shoe.variants.all(), key=lambda variant: variant.pk)
+    if reserved is None:
+        reserved = reservations.reserved_quantities([variant.pk for variant in variants])
+    rows = {}
+    sizes = set()
+    for variant in variants:
+        size = availability.canonical_size(variant.size_system, variant.size, shoe.gender)
+        sizes.add(size)
+        rows.setdefault(variant.color, []).append({
+            'variant_id': variant.pk,
+            'size': size,
+            'label': f'{variant.size_system} {variant.size.normalize():f}',
+            'available': availability.variant_available(variant, reserved.get(variant.pk, 0)),
+        })
+    for row in rows.values():
+        row.sort(key=lambda cell: (cell['size'], cell['variant_id']))
+    color_available = {color: any(cell['available'] for cell in row) for color, row in rows.items()}
+    return {
+        'colors': list(rows),
+        'sizes': sorted(sizes),
+        'rows': rows,
+        'color_available': color_available,
+        'available': any(color_available.values()),
+    }
+
+
+def variant_matrix(shoe):
+    """Cached matrix for ``shoe``; variants are only loaded on a miss."""
+    return catalog_cache.get_or_compute_for_shoe(
+        'variant_matrix', shoe.pk, lambda: build_matrix(shoe), MATRIX_TIMEOUT
+    )
+
+
+def variant_matrices(shoe_ids):
+    """``{shoe_id: matrix}`` for the shoes that exist; the misses load their variants in one query."""
+    def compute_many(missing):
+        shoes = list(Shoe.objects.filter(pk__in=missing).prefetch_related('variants'))
+        reserved = reservations.reserved_quantities([variant.pk for shoe in shoes for variant in shoe.variants.all()])
+        return {shoe.pk: build_matrix(shoe, reserved) for shoe in shoes}
+
+    return catalog_cache.get_many_for_shoes('variant_matrix', shoe_ids, compute_many, MATRIX_TIMEOUT)
+
+
+def default_color(matrix):
+    """First colour with an available variant, else the first colour (None if there are none)."""
+    for color in matrix['colors']:
+        if matrix['color_available'][color]:
+            return color
+    return matrix['colors'][0] if matrix['colors'] else None
+
+
+def invalidate(shoe_ids):
+    """Expire the cached matrices of the given shoes once the current transaction commits."""
+    shoe_ids = set(shoe_ids)
+    if shoe_ids:
+        transaction.on_commit(lambda: catalog_cache.bump_shoe_versions(shoe_ids))
@@ -1,14 +1,20 @@
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Q, Avg, Sum
+from django.db.models import F
 from models_app import models
 from .forms import Reviewform
+from . import availability, catalog_cache, eligibility, facets, filters, pagination, ratings, recommendations, search, variants
+from .suggest import suggester
 #from .models import Shoe,ShoeVariant,Review,OrderItem
 from django.views import generic
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse
 from django.http import Http404
+from django.core.exceptions import BadRequest
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from datetime import datetime, timezone
 #from django.http import HttpResponse
 
 # Create your views here.
@@ -49,7 +55,7 @@ class WishlistView(LoginRequiredMixin,generic.ListView):
     
     def get_queryset(self):
         # base queryset already refers to WishlistItem objects
-        qs = super().get_queryset().select_related('customer', 'shoe').prefetch_related('shoe__images')
+        qs = super().get_queryset().select_related('customer', 'shoe').prefetch_related(models.primary_image_prefetch('shoe__images'))
         customer = self.request.user.customer_profile if self.request.user.is_authenticated else None
         if customer:
             # filter WishlistItem rows for this customer so template receives objects
@@ -60,33 +66,27 @@ class ShoeDetailView(generic.DetailView):
     model = models.Shoe
     template_name = 'products/details.html'
     context_object_name = 'shoe'
-    queryset = models.Shoe.objects.prefetch_related('images', 'variants')
+    # variants come from the cached matrix, so only images are prefetched
+    queryset = models.Shoe.objects.select_related('brand').prefetch_related('images')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         shoe = self.object
+        matrix = variants.variant_matrix(shoe)
 
-        # create dictionary for colour availability based on variant availability
-        color_available = {}
-        for color in shoe.variants.values_list('color', flat=True).distinct():
-            color_variants = shoe.variants.filter(color=color)
-            color_available[color] = any(variant.is_available for variant in color_variants)
-
-        main_image = shoe.images.first()
-
-        # get selected colour from query parameters
+        # get selected colour from query parameters, else the first one in stock
         selected_color = self.request.GET.get('color')
-        # select the first if none selected
-        if selected_color is None:
-            selected_color = list(color_available.keys())[0]
-        # get variants for the selected colour
-        variants = shoe.variants.filter(color=selected_color).order_by('size') if selected_color else None
+        if selected_color not in matrix['rows']:
+            selected_color = variants.default_color(matrix)
 
         context.update({
-            'main_image': main_image,
-            'color_available': color_available,
+            'main_image': shoe.primary_image,
+            'variant_matrix': matrix,
+            'color_available': matrix['color_available'],
             'selected_color': selected_color,
-            'variants': variants,
+            'variants': matrix['rows'].get(selected_color, []),
+            'is_available': matrix['available'],
+            'frequently_bought_together': recommendations.frequently_bought_with(shoe),
         })
         return context
     
@@ -95,48 +95,117 @@ class ShoeListView(generic.ListView):
     template_name = 'products/search.html'
     context_object_name = 'shoes'
     paginate_by = 6
+    ordering = ('price', 'name', 'shoe_id')
+    # best rated first, unrated shoes last
+    rating_ordering = (F('rating_stats__average').desc(nulls_last=True), '-rating_stats__count', 'shoe_id')
+    # keyword searches default to relevance, everything else to the price ordering
+    sort_choices = {'relevance': 'Best match', 'price': 'Price: low to high', 'rating': 'Top rated'}
+    rating_choices = {4: '4 stars & up', 3: '3 stars & up', 2: '2 stars & up'}
+    # lifetime of cached result ids and dropdown data (entries also die with the catalog version)
+    cache_timeout = 60 * 10
+
+    def get_filters(self):
+        return filters.normalize_filters(self.request.GET)
+
+    def get_base_queryset(self):
+        # card data (image, availability, rating) comes from the joined listing row
+        return models.Shoe.objects.all().select_related('listing')
+
+    def get_sort(self):
+        has_query = 'q' in self.get_filters()
+        sort = self.request.GET.get('sort', '').strip()
+        if sort not in self.sort_choices or (sort == 'relevance' and not has_query):
+            sort = 'relevance' if has_query else 'price'
+        return sort
+
+    def get_shoe_ids(self):
+        """Ordered ids of every matching shoe, cached per filter set, sort and catalog version.
+
+        Size and colour filters also key the entry on the availability version.
+        """
+        shoe_filters = self.get_filters()
+        sort = self.get_sort()
+        params = {**shoe_filters, 'sort': sort, 'ordering': ','.join(self.ordering)}
+
+        def compute():
+            if sort == 'relevance':
+                return filters.ranked_shoe_ids(shoe_filters, limit=search.TOP_K)
+            qs = filters.filter_shoes(models.Shoe.objects.all(), shoe_filters)
+            ordering = self.rating_ordering if sort == 'rating' else self.ordering
+            return list(qs.order_by(*ordering).values_list('pk', flat=True))
+
+        return catalog_cache.get_or_compute(
+            'listing_ids', params, compute, self.cache_timeout, availability=filters.uses_stock(shoe_filters)
+        )
 
     def get_queryset(self):
-        # retrieve GET query parameters
-        q = self.request.GET.get('q', '').strip() #keyword
-        category = self.request.GET.get('category', '').strip()
-        brand_id = self.request.GET.get('brand', '').strip()
-        gender = self.request.GET.get('gender', '').strip()
-        min_price = self.request.GET.get('min_price', '').strip()
-        max_price = self.request.GET.get('max_price', '').strip()
-
-        #Get all objects with images
-        qs = models.Shoe.objects.all().prefetch_related('images')
-
-        #Build results queryset
-        if q:
-            qs = qs.filter(Q(name__icontains=q) | Q(description__icontains=q))
-
-        if category:
-            qs = qs.filter(category__iexact=category)
-
-        if brand_id:
-            brand_id = int(brand_id)
-            qs = qs.filter(brand_id=brand_id)
-
-        if gender:
-            qs = qs.filter(gender__iexact=gender)
+        if self.use_cursor_pagination():
+            qs = filters.filter_shoes(self.get_base_queryset(), self.get_filters())
+            return qs.order_by(*self.ordering)
+        # offset paging slices the cached id list and loads just that page
+        return pagination.ObjectIdList(self.get_shoe_ids(), self.get_base_queryset())
+
+    def get_brands(self):
+        return catalog_cache.get_or_compute(
+            'brands', None, lambda: list(models.Brand.objects.order_by('name')), self.cache_timeout
+        )
 
-        if min_price:
-            qs = qs.filter(price__gte=float(min_price))
+    def get_variant_options(self):
+        """Sizes and colours in stock anywhere in the catalog, for the filter dropdowns."""
+        return catalog_cache.get_or_compute(
+            'variant_options',
+            None,
+            lambda: {'sizes': availability.size_options(), 'colors': availability.color_options()},
+            self.cache_timeout,
+            availability=True,
+        )
 
-        if max_price:
-            qs = qs.filter(price__lte=float(max_price))
+    def use_cursor_pagination(self):
+        # opt-in: any ?cursor= parameter (empty for the first page) switches to keyset paging;
+        # relevance order has no sort key to seek on, so it always pages the cached id list
+        return 'cursor' in self.request.GET and self.get_sort() == 'price'
 
-        return qs.order_by('price', 'name')
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = pagination.CursorPaginator(queryset, self.ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except pagination.InvalidCursor:
+            raise BadRequest('Invalid page cursor')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_approximate_total(self):
+        # length of the cached id list: exact as of the current catalog version, no COUNT(*)
+        return len(self.get_shoe_ids())
+
+    def get_cursor_context(self, page):
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        context = {
+            'cursor_pagination': True,
+            'approximate_total': self.get_approximate_total(),
+        }
+        for name, cursor in (('next_query', page.next_cursor), ('previous_query', page.previous_cursor)):
+            if cursor:
+                params['cursor'] = cursor
+                context[name] = params.urlencode()
+        return context
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         # brands, genders and categories for dropdowns
-        brands = models.Brand.objects.all().order_by('name')
+        brands = self.get_brands()
         genders = models.Shoe.GENDER_CHOICES
         categories = models.Shoe.CATEGORY_CHOICES
+        variant_options = self.get_variant_options()
+
+        # counts per dropdown option for the current filters
+        counts = facets.facet_counts(self.get_filters())
+
+        if self.use_cursor_pagination():
+            context.update(self.get_cursor_context(context['page_obj']))
 
         # keep original query strings
         q = self.request.GET.get('q', '').strip()
@@ -145,6 +214,7 @@ class ShoeListView(generic.ListView):
         gender = self.request.GET.get('gender', '').strip()
         min_price = self.request.GET.get('min_price', '').strip()
         max_price = self.request.GET.get('max_price', '').strip()
+        shoe_filters = self.get_filters()
 
         context.update({
             'categories': categories,
@@ -156,6 +226,18 @@ class ShoeListView(generic.ListView):
             'selected_brand': brand,
             'min_price': min_price,
             'max_price': max_price,
+            'sizes': variant_options['sizes'],
+            'colors': variant_options['colors'],
+            'selected_size': shoe_filters.get('size'),
+            'selected_color': shoe_filters.get('color', ''),
+            'sort': self.get_sort(),
+            'sort_choices': self.sort_choices,
+            'rating_choices': self.rating_choices,
+            'selected_rating': shoe_filters.get('min_rating'),
+            'category_facets': facets.choice_options(categories, counts['category']),
+            'brand_facets': facets.brand_options(brands, counts['brand']),
+            'gender_facets': facets.choice_options(genders, counts['gender']),
+            'price_facets': facets.price_options(counts['price'], self.request.GET.copy()),
         })
 
         return context
@@ -163,10 +245,12 @@ class ShoeListView(generic.ListView):
 class ShoeByGenderListView(ShoeListView):
     template_name = 'products/shoe_by_gender.html'
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        gender = self.kwargs.get('gender', '').strip()
-        return qs.filter(gender__iexact=gender) if gender else qs
+    def get_filters(self):
+        shoe_filters = super().get_filters()
+        gender = self.kwargs.get('gender', '').strip().upper()
+        if gender:
+            shoe_filters['gender'] = gender
+        return shoe_filters
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -199,16 +283,12 @@ class ShoeByGenderListView(ShoeListView):
 class ShoeByBrandListView(ShoeListView):
     template_name = 'products/shoe_by_brand.html'
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        brand_id = self.kwargs.get('brand_id', '')
-        if not brand_id:
-            return qs
-        try:
-            bid = int(brand_id)
-            return qs.filter(pk=bid)
-        except (ValueError, TypeError):
-            return qs.filter(name__iexact=brand_id)
+    def get_filters(self):
+        shoe_filters = super().get_filters()
+        brand_id = self.kwargs.get('brand_id')
+        if brand_id:
+            shoe_filters['brand'] = int(brand_id)
+        return shoe_filters
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -242,26 +322,92 @@ class ShoeByBrandListView(ShoeListView):
 
         return context
     
-    
+
+def search_suggestions(request):
+    """JSON prefix suggestions (shoes, brands, categories) for the search box."""
+    q = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 5)), 10))
+    except ValueError:
+        limit = 5
+    return JsonResponse({'query': q, **suggester.suggest(q, limit)})
+
+
+MAX_AVAILABILITY_IDS = 50
+
+
+def _availability_versions(request):
+    """``{shoe_id: stock version}`` for the ?ids= of the request (None if malformed), memoized on the request."""
+    if not hasattr(request, '_availability_versions'):
+        raw = [part.strip() for value in request.GET.getlist('ids') for part in value.split(',')]
+        ids = [int(part) for part in raw if part.isdigit()]
+        if not ids or len(ids) != len(raw) or len(set(ids)) > MAX_AVAILABILITY_IDS:
+            request._availability_versions = None
+        else:
+            request._availability_versions = catalog_cache.shoe_versions(sorted(set(ids)))
+    return request._availability_versions
+
+
+def _availability_etag(request):
+    versions = _availability_versions(request)
+    if versions is None:
+        return None
+    return catalog_cache.params_digest(versions)
+
+
+def _availability_last_modified(request):
+    versions = _availability_versions(request)
+    if not versions:
+        return None
+    # shoe versions are change timestamps in nanoseconds
+    return datetime.fromtimestamp(max(versions.values()) / 1e9, tz=timezone.utc)
+
+
+@require_GET
+@cache_control(no_cache=True)
+@condition(etag_func=_availability_etag, last_modified_func=_availability_last_modified)
+def variant_availability(request):
+    """JSON colour x size availability for ?ids=1,2,3; answers 304 while no stock changed."""
+    versions = _availability_versions(request)
+    if versions is None:
+        return JsonResponse({'error': f'Pass 1 to {MAX_AVAILABILITY_IDS} numeric shoe ids as ?ids=.'}, status=400)
+    matrices = variants.variant_matrices(list(versions))
+    return JsonResponse({'shoes': {str(shoe_id): matrix for shoe_id, matrix in matrices.items()}})
+
+
+REVIEWS_PER_PAGE = 10
+# newest first; review_id breaks ties so the keyset is unique
+REVIEW_ORDERING = ('-date_added', '-review_id')
+
+
 def reviews(request,shoe_id):
-    shoe = get_object_or_404(models.Shoe,shoe_id=shoe_id)
-    reviews = models.Review.objects.filter(order_item__variant__shoe=shoe)
-    avg_rating = reviews.aggregate(average=Avg('rating'))['average']
-    # determine if the current user can leave a review: they must be authenticated
-    # and have at least one Order with status 'Delivered' containing this shoe
+    shoe = get_object_or_404(models.Shoe.objects.with_primary_image().select_related('rating_stats'), shoe_id=shoe_id)
+    rating_stats = ratings.rating_of(shoe)
+
+    # keyset pages, with the author chain joined in the same query
+    shoe_reviews = models.Review.objects.filter(order_item__variant__shoe=shoe).select_related('order_item__order__customer__user')
+    paginator = pagination.CursorPaginator(shoe_reviews, REVIEW_ORDERING, REVIEWS_PER_PAGE)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except pagination.InvalidCursor:
+        raise BadRequest('Invalid page cursor')
+
+    # determine if the current user can leave a review: they must have a delivered,
+    # not yet reviewed order item for this shoe
     can_leave_review = False
     if request.user.is_authenticated:
         customer = getattr(request.user, 'customer_profile', None)
         if customer:
-            delivered_orders = models.Order.objects.filter(customer=customer, status__iexact='delivered')
-            if delivered_orders.exists():
-                has_item = models.OrderItem.objects.filter(order__in=delivered_orders, variant__shoe=shoe).exists()
-                can_leave_review = bool(has_item)
+            can_leave_review = eligibility.can_review(customer, shoe)
 
     context = {
         'shoe': shoe,
-        'reviews': reviews,
-        'avg_rating': avg_rating,
+        'reviews': page.object_list,
+        'page_obj': page,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'avg_rating': rating_stats.average,
+        'rating_stats': rating_stats,
         'can_leave_review': can_leave_review,
     }
     return render(request, 'products/reviews.html', context)
@@ -271,27 +417,15 @@ def add_review(request, shoe_id):
     shoe = get_object_or_404(models.Shoe, shoe_id=shoe_id)
 
     order_item = None
-    if request.user.is_authenticated:
-        # pick the most recent delivered OrderItem
-        order_item = (
-            models.OrderItem.objects.filter(
-                variant__shoe=shoe,
-                order__customer__user=request.user,
-                order__status__iexact='delivered'
-            )
-            .select_related('order', 'variant')
-            .order_by('-order__delivery_date', '-order__order_date', '-pk')
-            .first()
-        )
+    customer = getattr(request.user, 'customer_profile', None)
+    if customer:
+        # the most recently delivered order item of this shoe that has no review yet
+        order_item = eligibility.reviewable_item(customer, shoe)
 
-    # Prevent users who haven't received the product from viewing the form
+    # Prevent users who haven't received the product (or already reviewed it) from viewing the form
     if not order_item:
         return HttpResponseForbidden('You must purchase and receive the product before reviewing it.')
 
-    # Prevent reviewing the same order_item more than once
-    if models.Review.objects.filter(order_item=order_item).exists():
-        return HttpResponseForbidden('This order item has already been reviewed.')
-
     if request.method == 'POST':
         form = Reviewform(request.POST, order_item=order_item, user=request.user)
         if form.is_valid():
@@ -1,3 +1,17 @@
-from django.test import TestCase
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from Core.models import OutboxEmail
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ContactTests(TestCase):
+    def test_message_is_queued_not_sent(self):
+        self.client.post(reverse('storefront:contact'), {
+            'fname': 'Alice', 'lname': 'Smith', 'email': 'alice@gmail.com', 'message': 'Do you ship to Mombasa?',
+        })
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.status, queued.reply_to), ('pending', ['alice@gmail.com']))
+        self.assertIn('Do you ship to Mombasa?', queued.body)
+        self.assertEqual(mail.outbox, [])
@@ -6,13 +6,17 @@ from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from django.views import generic
 from models_app import models
+from products import catalog_cache, merchandising
+from products.queries import top_n_per_group
 #for email sending
-from django.core.mail import send_mail
 from django.conf import settings
+from Core import outbox
 ###       home page
 def home(request):
     context={
-        'active_class':'home'
+        'active_class':'home',
+        # precomputed by the build_merchandising command
+        'merchandising_blocks': merchandising.home_blocks(),
     }
     return render(request,'storefront/home.html',context)
 
@@ -149,13 +153,13 @@ def contact(request):
         {message}
         """
 
-        # Send email
-        send_mail(
+        # Queue the email; the send_outbox worker delivers it
+        outbox.enqueue(
             subject,
             body,
-            settings.EMAIL_HOST_USER,        # sender (your account)
             ['admin@olivian.co.ke'],       # recipient (your inbox)
-            fail_silently=False,
+            from_email=getattr(settings, 'EMAIL_HOST_USER', ''),  # sender (your account)
+            reply_to=[email],
         )
 
         # … process form and send email …
@@ -164,16 +168,31 @@ def contact(request):
     return render(request, 'storefront/contact.html')
 
 
+CATEGORY_SAMPLES = 4
+CATEGORY_SAMPLES_TIMEOUT = 60 * 10
+
+
+def _category_samples():
+    # every category's samples in one window query, plus one for their images
+    shoes = top_n_per_group(
+        Shoe.objects.select_related('brand').with_primary_image(), 'category', ('shoe_id',), CATEGORY_SAMPLES
+    )
+    samples = {}
+    for shoe in shoes:
+        samples.setdefault(shoe.category, []).append(shoe)
+    return samples
+
+
 def categories(request):
     #Lists a few samples from each category
     categories = Shoe.CATEGORY_CHOICES
+    samples = catalog_cache.get_or_compute('category_samples', None, _category_samples, CATEGORY_SAMPLES_TIMEOUT)
     categories_list = []
     for code, label in categories.items():
-        samples = list(Shoe.objects.filter(category=code)[:4])
         categories_list.append({
             'code': code,
             'label': label,
-            'shoes': samples,
+            'shoes': samples.get(code, []),
         })
 
     context = {